@@ -5,32 +5,226 @@ Claude Code Logger - Core functionality for tracking Claude Code interactions
 
 import os
 import time
-import json
+import queue
+import socket
+import atexit
+import logging
+import functools
+import threading
 from datetime import datetime
-from typing import Dict, Any, List, Optional
+from typing import TYPE_CHECKING, Dict, Any, List, Optional
 from pathlib import Path
 
-# Load environment variables from .env file if it exists
+logger = logging.getLogger(__name__)
+
+if TYPE_CHECKING:
+    import httpx
+    from langfuse import Langfuse
+else:
+    # Imported on first logger construction so `import claude_logger` stays fast
+    Langfuse = None
+
 try:
-    from dotenv import load_dotenv
-    # Try to load from current directory first, then from user's claude directory
-    env_paths = [
+    import orjson
+except ImportError:
+    orjson = None  # Optional: faster encoding of large span payloads
+
+
+class _FrozenDict(dict):
+    """Read-only dict used as a shared empty default; serializes like a plain dict"""
+
+    __slots__ = ()
+
+    def _readonly(self, *args, **kwargs):
+        raise TypeError("shared empty default is read-only")
+
+    __setitem__ = __delitem__ = __ior__ = _readonly
+    clear = pop = popitem = setdefault = update = _readonly
+
+
+# Shared empty defaults so the logging path doesn't allocate a fresh {}/[] per call
+_EMPTY_DICT: Dict[str, Any] = _FrozenDict()
+_EMPTY_TUPLE: tuple = ()
+
+# Span names for Claude Code's built-in tools, so the common case needs no string building
+_TOOL_SPAN_NAMES = {
+    name: "tool_" + name
+    for name in ("Bash", "Read", "Write", "Edit", "MultiEdit", "Glob", "Grep", "LS",
+                 "WebFetch", "WebSearch", "Task", "TodoWrite", "NotebookEdit")
+}
+
+# LangFuse clients shared by every logger with the same connection settings
+_client_cache: Dict[tuple, "Langfuse"] = {}
+# Keep-alive HTTP pools created for (and closed together with) those shared clients
+_http_clients: Dict[tuple, "httpx.Client"] = {}
+_client_lock = threading.Lock()
+
+# Repeated ingestion calls reuse pooled connections instead of redoing DNS, TCP and TLS
+_HTTP_LIMITS = {"max_keepalive_connections": 20, "max_connections": 100, "keepalive_expiry": 30.0}
+# No Nagle delay on small single-trace requests; keep-alive probes detect dead idle connections
+_SOCKET_OPTIONS = [
+    (socket.IPPROTO_TCP, socket.TCP_NODELAY, 1),
+    (socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1),
+]
+
+# Records waiting to be submitted to LangFuse when async logging is enabled
+_log_queue: "queue.Queue[Dict[str, Any]]" = queue.Queue(maxsize=10000)
+# Longest end_session waits for queued records before closing the session anyway
+_QUEUE_DRAIN_TIMEOUT = 10.0
+_dropped_records = 0
+_worker: Optional[threading.Thread] = None
+_worker_lock = threading.Lock()
+
+
+@functools.lru_cache(maxsize=1)
+def load_env() -> Optional[Path]:
+    """
+    Load environment variables from the first .env file found (once per process)
+
+    Looks in the current directory, then the user's claude directory, then next to
+    this module. Variables already set in the environment take precedence.
+
+    Returns:
+        Path of the loaded file, if any
+    """
+    try:
+        from dotenv import load_dotenv
+    except ImportError:
+        return None
+
+    env_paths = (
         Path.cwd() / '.env',
         Path.home() / '.claude' / 'langfuse.env',
         Path(__file__).parent / '.env'
-    ]
-    for env_path in env_paths:
-        if env_path.exists():
-            load_dotenv(env_path)
-            break
-except ImportError:
-    pass
+    )
+    env_path = next((path for path in env_paths if path.exists()), None)
+    if env_path:
+        load_dotenv(env_path, override=False)
+    return env_path
 
-try:
-    from langfuse import Langfuse
-except ImportError:
-    print("❌ LangFuse not installed. Run: pip install langfuse")
-    exit(1)
+
+def _truncate(value: Any, max_chars: int = 65536) -> Any:
+    """
+    Shrink an oversized string payload to its head and tail
+
+    Args:
+        value: Payload to check (non-strings are returned unchanged)
+        max_chars: Largest string sent as-is
+
+    Returns:
+        The original value, or a dict describing the truncated string
+    """
+    if not isinstance(value, str) or len(value) <= max_chars:
+        return value
+    return {
+        "truncated": True,
+        "original_len": len(value),
+        "head": value[:max_chars // 2],
+        "tail": value[-(max_chars // 4):]
+    }
+
+
+def _encode_payload(payload: Any) -> Any:
+    """
+    Pre-serialize a span payload with orjson when it is installed
+
+    LangFuse passes string payloads through as-is, so this replaces the SDK's
+    stdlib json encoding. Payloads orjson can't encode are returned unchanged.
+    """
+    if orjson is None:
+        return payload
+    try:
+        return orjson.dumps(payload).decode()
+    except TypeError:
+        return payload
+
+
+def _environment_proxies() -> Dict[str, Optional[str]]:
+    """
+    Proxy mounts from HTTP(S)_PROXY, ALL_PROXY and NO_PROXY, as httpx itself builds them
+
+    httpx skips the environment whenever an explicit transport is passed, so the pool
+    applies these itself. Returns URL patterns mapped to a proxy URL, or to None for
+    hosts that bypass the proxy.
+    """
+    import ipaddress
+    from urllib.request import getproxies
+
+    proxy_info = getproxies()
+    mounts: Dict[str, Optional[str]] = {}
+    for scheme in ("http", "https", "all"):
+        proxy = proxy_info.get(scheme)
+        if proxy:
+            mounts[f"{scheme}://"] = proxy if "://" in proxy else f"http://{proxy}"
+
+    # NO_PROXY entries follow curl: "*" disables proxies, a domain also covers its subdomains
+    for host in (host.strip() for host in proxy_info.get("no", "").split(",")):
+        if host == "*":
+            return {}
+        if not host:
+            continue
+        if "://" in host:
+            mounts[host] = None
+            continue
+        try:
+            address = ipaddress.ip_address(host.split("/")[0])
+        except ValueError:
+            mounts[f"all://{host}" if host.lower() == "localhost" else f"all://*{host}"] = None
+        else:
+            mounts[f"all://[{host}]" if address.version == 6 else f"all://{host}"] = None
+    return mounts
+
+
+def _build_http_client() -> "httpx.Client":
+    """Create the pooled HTTP client owned by a shared LangFuse client"""
+    import httpx
+    limits = httpx.Limits(**_HTTP_LIMITS)
+    mounts = {
+        pattern: None if proxy is None else httpx.HTTPTransport(
+            proxy=httpx.Proxy(proxy), limits=limits, socket_options=_SOCKET_OPTIONS
+        )
+        for pattern, proxy in _environment_proxies().items()
+    }
+    transport = httpx.HTTPTransport(limits=limits, socket_options=_SOCKET_OPTIONS)
+    return httpx.Client(transport=transport, mounts=mounts)
+
+
+def _log_worker():
+    """Drain queued records and submit them to LangFuse"""
+    while True:
+        record = _log_queue.get()
+        try:
+            record["logger"]._dispatch(record)
+        finally:
+            _log_queue.task_done()
+
+
+def _drain_log_queue(timeout: float) -> bool:
+    """
+    Wait until every queued record has been submitted, or timeout seconds pass
+
+    Unlike Queue.join(), a stalled worker (e.g. a hung LangFuse request) can't block forever.
+
+    Returns:
+        True if the queue drained in time
+    """
+    deadline = time.monotonic() + timeout
+    with _log_queue.all_tasks_done:
+        while _log_queue.unfinished_tasks:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            _log_queue.all_tasks_done.wait(remaining)
+    return True
+
+
+def _ensure_worker():
+    """Start the background queue worker if it isn't running yet"""
+    global _worker
+    with _worker_lock:
+        if _worker is None:
+            _worker = threading.Thread(target=_log_worker, name="claude-logger-queue", daemon=True)
+            _worker.start()
 
 
 class ClaudeCodeLogger:
@@ -47,7 +241,8 @@ class ClaudeCodeLogger:
     def __init__(self,
                  user_id: Optional[str] = None,
                  session_id: Optional[str] = None,
-                 config: Optional[Dict] = None):
+                 config: Optional[Dict] = None,
+                 httpx_client: Optional["httpx.Client"] = None):
         """
         Initialize the Claude Code logger
 
@@ -55,31 +250,110 @@ class ClaudeCodeLogger:
             user_id: User identifier (email or username)
             session_id: Optional session ID (auto-generated if not provided)
             config: Optional configuration dictionary
+            httpx_client: Optional HTTP client handed to a newly created shared LangFuse client
+                (owned by the caller; by default the shared client gets its own keep-alive pool)
         """
+        load_env()
+
         self.user_id = user_id or os.getenv("CLAUDE_USER_ID", "anonymous")
-        self.session_id = session_id or f"claude_session_{int(time.time())}"
+        self.session_id = session_id or f"claude_session_{time.time_ns() // 1_000_000_000}"
         self.interaction_count = 0
         self.start_time = datetime.now()
+        self._start_monotonic = time.monotonic()
+
+        # Invariant identifiers shared by every span this logger emits
+        self._base_metadata = {"user_id": self.user_id, "session_id": self.session_id}
+        self._interaction_id_prefix = self.session_id + "_"
+
+        # Per-interaction flushing is opt-in; the SDK batches spans in the background
+        self.enforce_flush = os.getenv("CLAUDE_LANGFUSE_ENFORCE_FLUSH", "false").lower() == "true"
+        # Async logging moves LangFuse calls for interactions and tools onto a worker thread
+        self.async_logging = os.getenv("CLAUDE_LANGFUSE_ASYNC", "false").lower() == "true"
+        self.session_score = os.getenv("CLAUDE_LANGFUSE_SESSION_SCORE", "false").lower() == "true"
+        # Prompts, responses and tool outputs longer than this are sent as head + tail
+        self.max_payload_chars = int(os.getenv("CLAUDE_LANGFUSE_MAX_PAYLOAD_CHARS", "65536"))
+        # Tools are recorded on the interaction span; separate per-tool spans are opt-in
+        self.tool_spans = os.getenv("CLAUDE_LANGFUSE_TOOL_SPANS", "false").lower() == "true"
 
         # Initialize LangFuse
-        self.langfuse = self._init_langfuse(config)
+        self.langfuse = self._init_langfuse(config, httpx_client)
         self.current_trace_id = None
+        self._flush_thread: Optional[threading.Thread] = None
+
+        if self.async_logging:
+            _ensure_worker()
 
-    def _init_langfuse(self, config: Optional[Dict] = None) -> Langfuse:
+    def _init_langfuse(self,
+                       config: Optional[Dict] = None,
+                       httpx_client: Optional["httpx.Client"] = None) -> "Langfuse":
         """Initialize LangFuse client with configuration"""
+        global Langfuse
+        if Langfuse is None:
+            try:
+                from langfuse import Langfuse
+            except ImportError:
+                raise ImportError("LangFuse not installed. Run: pip install langfuse")
+
         if config:
-            return Langfuse(
-                host=config.get("host", "http://localhost:3001"),
-                public_key=config["public_key"],
-                secret_key=config["secret_key"]
-            )
+            host = config.get("host", "http://localhost:3001")
+            public_key = config["public_key"]
+            secret_key = config["secret_key"]
         else:
             # Use environment variables
-            return Langfuse(
-                host=os.getenv("LANGFUSE_HOST", "http://localhost:3001"),
-                public_key=os.getenv("LANGFUSE_PUBLIC_KEY"),
-                secret_key=os.getenv("LANGFUSE_SECRET_KEY")
-            )
+            host = os.getenv("LANGFUSE_HOST", "http://localhost:3001")
+            public_key = os.getenv("LANGFUSE_PUBLIC_KEY")
+            secret_key = os.getenv("LANGFUSE_SECRET_KEY")
+
+        # Batch spans into fewer ingestion requests: send every flush_at spans or flush_interval seconds
+        config = config or _EMPTY_DICT
+        flush_at = int(config.get("flush_at", os.getenv("LANGFUSE_FLUSH_AT", "50")))
+        flush_interval = float(config.get("flush_interval", os.getenv("LANGFUSE_FLUSH_INTERVAL", "2.0")))
+
+        # Reuse one client (and its connection pool and export thread) per distinct set
+        # of settings, so a logger never silently inherits another's credentials or batching.
+        # The cached client holds the injected httpx client, so its id stays unique.
+        with _client_lock:
+            key = (host, public_key, secret_key, flush_at, flush_interval,
+                   id(httpx_client) if httpx_client is not None else None)
+            if key not in _client_cache:
+                owned_http_client = None
+                if httpx_client is None:
+                    httpx_client = owned_http_client = _build_http_client()
+                try:
+                    _client_cache[key] = Langfuse(
+                        host=host,
+                        public_key=public_key,
+                        secret_key=secret_key,
+                        flush_at=flush_at,
+                        flush_interval=flush_interval,
+                        httpx_client=httpx_client
+                    )
+                except Exception:
+                    if owned_http_client is not None:
+                        owned_http_client.close()
+                    raise
+                if owned_http_client is not None:
+                    _http_clients[key] = owned_http_client
+            return _client_cache[key]
+
+    @staticmethod
+    def shutdown_shared_client():
+        """Flush and shut down all shared LangFuse clients (registered to run at exit)"""
+        with _client_lock:
+            clients = list(_client_cache.values())
+            http_clients = list(_http_clients.values())
+            _client_cache.clear()
+            _http_clients.clear()
+
+        for client in clients:
+            try:
+                client.shutdown()
+            except Exception as e:
+                logger.warning(f"Failed to shut down LangFuse client: {e}")
+
+        # Only after the final flushes, which still send through these pools
+        for http_client in http_clients:
+            http_client.close()
 
     def start_session(self, metadata: Optional[Dict] = None) -> str:
         """
@@ -99,13 +373,12 @@ class ClaudeCodeLogger:
                 # Enhanced session metadata
                 session_input = {
                     "session_start": datetime.now().isoformat(),
-                    "user_id": self.user_id,
-                    "session_id": self.session_id,
+                    **self._base_metadata,
                     "session_type": "claude_code_session"
                 }
 
                 # Merge with provided metadata
-                full_metadata = {**(metadata or {})}
+                full_metadata = {**(metadata or _EMPTY_DICT)}
                 if "project_name" in full_metadata:
                     session_input["project"] = full_metadata["project_name"]
                 if "project_path" in full_metadata:
@@ -113,26 +386,27 @@ class ClaudeCodeLogger:
 
                 # CRITICAL: Update the trace with session and user IDs at trace level
                 # This is what makes sessions appear in the LangFuse Sessions view
+                # Shared identifiers live here once rather than on every span
+                trace_metadata = {**self._base_metadata, **full_metadata}
+                if "project" in session_input:
+                    trace_metadata["project"] = session_input["project"]
                 self.langfuse.update_current_trace(
                     name="claude_code_session",
                     user_id=self.user_id,
                     session_id=self.session_id,
                     input=session_input,
-                    metadata=full_metadata,
+                    metadata=trace_metadata,
                     tags=full_metadata.get("tags", ["claude-code", "auto-discovered"])
                 )
 
                 # Update span with session information
-                self.langfuse.update_current_span(
-                    input=session_input,
-                    metadata=full_metadata
-                )
+                self.langfuse.update_current_span(input=session_input)
 
                 # Store trace ID for later use
                 self.current_trace_id = self.langfuse.get_current_trace_id()
 
-                # Create a score for session tracking
-                if self.current_trace_id:
+                # Create a score for session tracking (an extra write most users don't need)
+                if self.current_trace_id and self.session_score:
                     self.langfuse.create_score(
                         name="session_active",
                         trace_id=self.current_trace_id,
@@ -140,11 +414,11 @@ class ClaudeCodeLogger:
                         comment=f"Active session: {self.session_id}"
                     )
 
-            print(f"✅ Session started: {self.session_id}")
+            logger.info(f"Session started: {self.session_id}")
             return self.session_id
 
         except Exception as e:
-            print(f"⚠️ Failed to start session: {e}")
+            logger.warning(f"Failed to start session: {e}")
             return self.session_id
 
     def log_interaction(self,
@@ -164,11 +438,40 @@ class ClaudeCodeLogger:
             duration_ms: Response time in milliseconds
 
         Returns:
-            Interaction details including trace ID
+            Interaction details including trace ID (omitted when logged asynchronously)
         """
         self.interaction_count += 1
-        interaction_id = f"{self.session_id}_{self.interaction_count}"
-
+        interaction_id = self._interaction_id_prefix + str(self.interaction_count)
+        timestamp = datetime.now().isoformat()
+
+        if self.async_logging:
+            return self._enqueue({
+                "type": "interaction",
+                "interaction_id": interaction_id,
+                "interaction_number": self.interaction_count,
+                "timestamp": timestamp,
+                "user_prompt": user_prompt,
+                "claude_response": claude_response,
+                "tools_used": tools_used,
+                "context": context,
+                "duration_ms": duration_ms
+            })
+
+        return self._record_interaction(
+            interaction_id, self.interaction_count, timestamp,
+            user_prompt, claude_response, tools_used, context, duration_ms
+        )
+
+    def _record_interaction(self,
+                            interaction_id: str,
+                            interaction_number: int,
+                            timestamp: str,
+                            user_prompt: str,
+                            claude_response: str,
+                            tools_used: Optional[List[Dict]] = None,
+                            context: Optional[Dict] = None,
+                            duration_ms: Optional[int] = None) -> Dict[str, Any]:
+        """Submit a Claude Code interaction to LangFuse"""
         try:
             with self.langfuse.start_as_current_span(
                 name="claude_interaction"
@@ -182,25 +485,24 @@ class ClaudeCodeLogger:
 
                 # Log the interaction
                 self.langfuse.update_current_span(
-                    input={
-                        "prompt": user_prompt,
-                        "interaction_number": self.interaction_count,
-                        "context": context or {}
-                    },
-                    output={
-                        "response": claude_response,
-                        "tools_used": tools_used or [],
+                    input=_encode_payload({
+                        "prompt": _truncate(user_prompt, self.max_payload_chars),
+                        "interaction_number": interaction_number,
+                        "context": context or _EMPTY_DICT
+                    }),
+                    output=_encode_payload({
+                        "response": _truncate(claude_response, self.max_payload_chars),
+                        "tools_used": [self._truncate_tool(tool) for tool in tools_used or _EMPTY_TUPLE],
                         "duration_ms": duration_ms
-                    },
+                    }),
                     metadata={
-                        "user_id": self.user_id,
-                        "session_id": self.session_id,
-                        "timestamp": datetime.now().isoformat()
+                        "timestamp": timestamp,
+                        "tools": [tool.get("name") for tool in tools_used or _EMPTY_TUPLE]
                     }
                 )
 
-                # Log individual tool usage
-                if tools_used:
+                # Log individual tool usage as child spans only when requested
+                if tools_used and self.tool_spans:
                     for tool in tools_used:
                         self._log_tool_usage(tool)
 
@@ -214,27 +516,74 @@ class ClaudeCodeLogger:
                         name="interaction_quality",
                         trace_id=trace_id,
                         value=score,
-                        comment=f"Interaction {self.interaction_count}"
+                        comment=f"Interaction {interaction_number}"
                     )
 
-                # Flush for real-time tracking
-                self.langfuse.flush()
+                # Flush for real-time tracking only when explicitly requested
+                if self.enforce_flush:
+                    self.langfuse.flush()
 
                 return {
                     "interaction_id": interaction_id,
                     "trace_id": trace_id,
-                    "interaction_count": self.interaction_count
+                    "interaction_count": interaction_number
                 }
 
         except Exception as e:
-            print(f"⚠️ Failed to log interaction: {e}")
+            logger.warning(f"Failed to log interaction: {e}")
             return {"interaction_id": interaction_id, "error": str(e)}
 
+    def log_tool_usage(self, tool_info: Dict[str, Any]):
+        """
+        Log individual tool usage outside of an interaction
+
+        Args:
+            tool_info: Tool details (name, input, output, success, duration_ms)
+        """
+        if self.async_logging:
+            self._enqueue({"type": "tool", "tool_info": tool_info})
+        else:
+            self._log_tool_usage(tool_info)
+
+    def _enqueue(self, record: Dict[str, Any]) -> Dict[str, Any]:
+        """Queue a record for the background worker, dropping it if the queue is full"""
+        global _dropped_records
+        record["logger"] = self
+        try:
+            _log_queue.put_nowait(record)
+        except queue.Full:
+            _dropped_records += 1
+            logger.warning(f"Log queue full, dropped {_dropped_records} records so far")
+            return {"interaction_id": record.get("interaction_id"), "error": "queue full"}
+
+        return {
+            "interaction_id": record.get("interaction_id"),
+            "interaction_count": record.get("interaction_number"),
+            "queued": True
+        }
+
+    def _dispatch(self, record: Dict[str, Any]):
+        """Submit a queued record to LangFuse (runs on the worker thread)"""
+        if record["type"] == "interaction":
+            self._record_interaction(
+                record["interaction_id"], record["interaction_number"], record["timestamp"],
+                record["user_prompt"], record["claude_response"],
+                record["tools_used"], record["context"], record["duration_ms"]
+            )
+        elif record["type"] == "tool":
+            self._log_tool_usage(record["tool_info"])
+
     def _log_tool_usage(self, tool_info: Dict[str, Any]):
         """Log individual tool usage"""
+        if not tool_info:
+            return
+
+        tool_name = tool_info.get("name", "unknown")
+        span_name = _TOOL_SPAN_NAMES.get(tool_name) or "tool_" + str(tool_name)
+
         try:
             with self.langfuse.start_as_current_span(
-                name=f"tool_{tool_info.get('name', 'unknown')}"
+                name=span_name
             ) as span:
 
                 # CRITICAL: Ensure tool usage is associated with the session
@@ -244,19 +593,25 @@ class ClaudeCodeLogger:
                 )
 
                 self.langfuse.update_current_span(
-                    input=tool_info.get("input", {}),
-                    output=tool_info.get("output", {}),
+                    input=_encode_payload(tool_info.get("input", _EMPTY_DICT)),
+                    output=_encode_payload(_truncate(tool_info.get("output", _EMPTY_DICT), self.max_payload_chars)),
                     metadata={
                         "tool_name": tool_info.get("name"),
                         "success": tool_info.get("success", True),
-                        "duration_ms": tool_info.get("duration_ms", 0),
-                        "user_id": self.user_id,
-                        "session_id": self.session_id
+                        "duration_ms": tool_info.get("duration_ms", 0)
                     }
                 )
 
         except Exception as e:
-            print(f"⚠️ Failed to log tool: {e}")
+            logger.warning(f"Failed to log tool: {e}")
+
+    def _truncate_tool(self, tool_info: Dict[str, Any]) -> Dict[str, Any]:
+        """Return tool info with an oversized string output truncated"""
+        output = tool_info.get("output")
+        truncated = _truncate(output, self.max_payload_chars)
+        if truncated is output:
+            return tool_info
+        return {**tool_info, "output": truncated}
 
     def _calculate_quality_score(self,
                                 prompt: str,
@@ -271,31 +626,42 @@ class ClaudeCodeLogger:
         - +0.2 for detailed responses (>100 chars)
         - +0.1 for each tool used (max 0.3)
         """
-        score = 0.5
-
-        if len(prompt) > 50:
-            score += 0.2
-
-        if len(response) > 100:
-            score += 0.2
-
-        if tools:
-            tool_bonus = min(0.3, len(tools) * 0.1)
-            score += tool_bonus
-
-        return min(1.0, score)
-
-    def end_session(self, summary: Optional[str] = None) -> Dict[str, Any]:
+        score = (0.5
+                 + 0.2 * (len(prompt) > 50)
+                 + 0.2 * (len(response) > 100)
+                 + (min(0.3, len(tools) * 0.1) if tools else 0.0))
+        return score if score < 1.0 else 1.0
+
+    def end_session(self,
+                    summary: Optional[str] = None,
+                    force_flush: bool = False) -> Dict[str, Any]:
         """
         End the tracking session
 
         Args:
             summary: Optional session summary
+            force_flush: Flush synchronously instead of on a background thread
 
         Returns:
             Session statistics
         """
-        duration = (datetime.now() - self.start_time).total_seconds()
+        # Queued interactions must land before the session is closed
+        if self.async_logging:
+            if not _drain_log_queue(_QUEUE_DRAIN_TIMEOUT):
+                logger.warning(
+                    f"Gave up waiting for {_log_queue.unfinished_tasks} queued LangFuse records "
+                    f"after {_QUEUE_DRAIN_TIMEOUT:.0f}s; ending session {self.session_id} anyway"
+                )
+
+        duration = time.monotonic() - self._start_monotonic
+
+        # Nothing happened in this session, so there is nothing worth sending
+        if self.interaction_count == 0 and not summary:
+            return {
+                "total_interactions": 0,
+                "session_duration_seconds": duration,
+                "average_interaction_time": duration
+            }
 
         try:
             # Log session end
@@ -320,11 +686,7 @@ class ClaudeCodeLogger:
                         "summary": summary or "Session completed",
                         "statistics": stats
                     },
-                    metadata={
-                        "user_id": self.user_id,
-                        "session_id": self.session_id,
-                        "end_time": datetime.now().isoformat()
-                    }
+                    metadata={"end_time": datetime.now().isoformat()}
                 )
 
             # Add session score
@@ -337,19 +699,39 @@ class ClaudeCodeLogger:
                     comment=f"{self.interaction_count} interactions over {duration:.0f}s"
                 )
 
-            # Final flush
-            self.langfuse.flush()
+            # Final flush, off the caller's thread unless synchronous semantics are needed
+            if force_flush:
+                self.langfuse.flush()
+            else:
+                self._flush_thread = threading.Thread(target=self.langfuse.flush, daemon=True)
+                self._flush_thread.start()
 
-            print(f"✅ Session ended: {self.session_id}")
-            print(f"   Total interactions: {self.interaction_count}")
-            print(f"   Duration: {duration:.0f} seconds")
+            logger.info(
+                f"Session ended: {self.session_id} "
+                f"({self.interaction_count} interactions, {duration:.0f} seconds)"
+            )
 
             return stats
 
         except Exception as e:
-            print(f"⚠️ Failed to end session: {e}")
+            logger.warning(f"Failed to end session: {e}")
             return {"error": str(e)}
 
+    def wait_for_flush(self, timeout: Optional[float] = None) -> bool:
+        """
+        Wait for a background flush started by end_session to finish
+
+        Args:
+            timeout: Maximum seconds to wait (waits indefinitely if not provided)
+
+        Returns:
+            True if no flush is pending
+        """
+        if self._flush_thread:
+            self._flush_thread.join(timeout)
+            return not self._flush_thread.is_alive()
+        return True
+
     def get_trace_url(self, trace_id: Optional[str] = None) -> str:
         """
         Get the LangFuse dashboard URL for a trace
@@ -377,11 +759,14 @@ class ClaudeCodeLogger:
         self.end_session()
 
 
+atexit.register(ClaudeCodeLogger.shutdown_shared_client)
+
+
 # Convenience functions
 def quick_log(prompt: str, response: str, tools: Optional[List] = None):
-    """Quick logging without session management"""
-    logger = ClaudeCodeLogger()
-    logger.start_session()
-    result = logger.log_interaction(prompt, response, tools)
-    logger.end_session()
+    """Quick logging without session management (reuses the shared LangFuse client)"""
+    session = ClaudeCodeLogger()
+    session.start_session()
+    result = session.log_interaction(prompt, response, tools)
+    session.end_session()
     return result
\ No newline at end of file
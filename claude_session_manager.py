@@ -8,11 +8,12 @@ import os
 import sys
 import json
 import time
+import atexit
 import signal
-import psutil
+import threading
 from pathlib import Path
 from typing import Dict, Optional
-from claude_logger import ClaudeCodeLogger
+from claude_logger import ClaudeCodeLogger, load_env
 import logging
 
 logger = logging.getLogger(__name__)
@@ -27,6 +28,9 @@ class ClaudeSessionManager:
         self.logger_instance: Optional[ClaudeCodeLogger] = None
         self.session_id: Optional[str] = None
         self.pid = os.getpid()
+        self._terminal: Optional[str] = None
+        self._cleanup_registered = False
+        load_env()
         self.auto_enabled = os.getenv("CLAUDE_LANGFUSE_AUTO", "true").lower() == "true"
 
         if auto_detect and self.auto_enabled:
@@ -36,7 +40,6 @@ class ClaudeSessionManager:
         """Automatically initialize session based on current process"""
         try:
             # Get current process info
-            proc = psutil.Process(self.pid)
             terminal = self._detect_terminal()
             working_dir = os.getcwd()
 
@@ -62,37 +65,48 @@ class ClaudeSessionManager:
             self.logger_instance.start_session(metadata)
             logger.info(f"Auto-initialized Claude session {self.session_id}")
 
-            # Register cleanup handler
-            signal.signal(signal.SIGTERM, self._cleanup_handler)
-            signal.signal(signal.SIGINT, self._cleanup_handler)
-
         except Exception as e:
             logger.error(f"Failed to auto-initialize session: {e}")
+            return
+
+        # Register cleanup handler
+        self._register_cleanup()
+
+    def _register_cleanup(self):
+        """Register shutdown hooks once; signal handlers can only be installed from the main thread"""
+        if self._cleanup_registered:
+            return
+        self._cleanup_registered = True
+
+        # Fallback that also covers sessions started from worker threads
+        atexit.register(self.end_session, "Process exited")
+
+        if threading.current_thread() is threading.main_thread():
+            signal.signal(signal.SIGTERM, self._cleanup_handler)
+            signal.signal(signal.SIGINT, self._cleanup_handler)
+        else:
+            logger.debug("Not running in the main thread, relying on atexit for cleanup")
 
     def _detect_terminal(self) -> str:
-        """Detect terminal session identifier"""
+        """Detect terminal session identifier (cached, it can't change for this process)"""
+        if self._terminal is None:
+            self._terminal = (
+                os.environ.get("TERM_SESSION_ID")
+                or os.environ.get("TMUX_PANE")
+                or os.environ.get("WINDOWID")
+                or self._try_tty()
+                or f"pid_{self.pid}"
+            )
+        return self._terminal
+
+    @staticmethod
+    def _try_tty() -> Optional[str]:
+        """Return the controlling tty name of stdin, if there is one"""
         try:
-            # Try various methods to identify terminal
-            terminal_methods = [
-                lambda: os.getenv("TERM_SESSION_ID"),
-                lambda: os.getenv("TMUX_PANE"),
-                lambda: os.getenv("WINDOWID"),
-                lambda: f"tty_{os.ttyname(sys.stdin.fileno()).split('/')[-1]}",
-                lambda: f"pid_{self.pid}"
-            ]
-
-            for method in terminal_methods:
-                try:
-                    result = method()
-                    if result:
-                        return str(result)
-                except:
-                    continue
-
-            return f"unknown_{self.pid}"
-
-        except Exception:
-            return f"fallback_{self.pid}"
+            return f"tty_{os.ttyname(sys.stdin.fileno()).split('/')[-1]}"
+        except (OSError, ValueError, AttributeError):
+            # Not a tty, closed, or missing stdin
+            return None
 
     def log_interaction(self, user_prompt: str, claude_response: str, tools_used: Optional[list] = None) -> Dict:
         """Log a Claude Code interaction"""
@@ -113,7 +127,7 @@ class ClaudeSessionManager:
             "success": success
         }
 
-        self.logger_instance._log_tool_usage(tool_info)
+        self.logger_instance.log_tool_usage(tool_info)
 
     def get_trace_url(self) -> Optional[str]:
         """Get the current trace URL"""
@@ -145,11 +159,16 @@ class ClaudeSessionManager:
 
     def __exit__(self, exc_type, exc_val, exc_tb):
         """Context manager exit"""
+        logger_instance = self.logger_instance
         if exc_type:
             self.end_session(f"Session ended with exception: {exc_type.__name__}")
         else:
             self.end_session("Session completed normally")
 
+        # Give the background flush a bounded chance to finish so short-lived scripts keep their data
+        if logger_instance:
+            logger_instance.wait_for_flush(timeout=2.0)
+
 # Global session manager instance
 _session_manager: Optional[ClaudeSessionManager] = None
 
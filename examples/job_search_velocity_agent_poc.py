@@ -8,10 +8,15 @@ observability, tracing, and performance monitoring.
 Phase 1 Evaluation - LangFuse Integration POC
 """
 
+import os
 import time
 import json
+import zlib
+import queue
+import threading
 import requests
-from datetime import datetime
+from collections import deque
+from datetime import datetime, timedelta
 from typing import Dict, List, Optional
 
 # LangFuse Configuration
@@ -19,27 +24,109 @@ LANGFUSE_HOST = "http://localhost:3001"
 LANGFUSE_PUBLIC_KEY = "pk-lf-..."  # Will be obtained from UI
 LANGFUSE_SECRET_KEY = "sk-lf-..."  # Will be obtained from UI
 
+# Simulated API latency per analysis run, in seconds (0 = run spans back-to-back)
+_SIM = float(os.getenv("POC_SIMULATE_LATENCY_SEC", "0"))
+
 # Mock LangFuse Integration (would use actual SDK in production)
 class MockLangFuseTracer:
     """Mock LangFuse tracing for demonstration"""
 
-    def __init__(self, host: str):
+    def __init__(self, host: str, sample_rate: Optional[float] = None, max_traces: int = 1000,
+                 batch_size: int = 100, batch_interval: float = 5.0):
         self.host = host
-        self.traces = []
+        # Head-based sampling: the keep/drop decision is made once per trace from its id
+        if sample_rate is None:
+            sample_rate = float(os.getenv("LANGFUSE_SAMPLE_RATE", "1.0"))
+        if not 0.0 <= sample_rate <= 1.0:
+            raise ValueError(f"sample_rate must be between 0.0 and 1.0, got {sample_rate}")
+        self.sample_rate = sample_rate
+        self._sample_threshold = sample_rate * 0x100000000
+        # Ring buffer of recent traces; aggregates below cover every trace ever recorded
+        self.traces = deque(maxlen=max_traces)
+        # Wall-clock anchor; spans record monotonic ns and are converted to ISO on export
+        self._epoch = datetime.utcnow()
+        self._epoch_ns = time.monotonic_ns()
+        # Running totals so summaries don't rescan every span
+        self._agg = {"traces": 0, "spans": 0, "latency_ms": 0, "cost_usd": 0.0, "tokens": 0}
+
+        # Finished spans are exported in batches from a background thread
+        self.batch_size = batch_size
+        self.batch_interval = batch_interval
+        self.batches_sent = 0
+        self._export_queue = queue.Queue()
+        threading.Thread(target=self._export_loop, daemon=True).start()
+
+    def _export_loop(self):
+        """Batch finished spans and send them every batch_size spans or batch_interval seconds"""
+        batch = []
+        deadline = time.monotonic() + self.batch_interval
+        while True:
+            try:
+                batch.append(self._export_queue.get(timeout=max(0.0, deadline - time.monotonic())))
+            except queue.Empty:
+                pass
+            if len(batch) >= self.batch_size or time.monotonic() >= deadline:
+                if batch:
+                    self._send_batch(batch)
+                    batch = []
+                deadline = time.monotonic() + self.batch_interval
+
+    def _send_batch(self, batch: List[Dict]):
+        """Stand-in for a batched POST to the LangFuse ingestion API"""
+        self.batches_sent += 1
+
+    def _record_span_end(self, span_data: Dict):
+        """Fold a finished span into the running totals and queue it for export"""
+        self._agg["spans"] += 1
+        self._agg["latency_ms"] += span_data["latency_ms"]
+        self._export_queue.put_nowait(span_data)
+
+    def _record_span_usage(self, cost_usd: float = 0.0, tokens_used: int = 0):
+        """Fold span cost and token usage into the running totals"""
+        self._agg["cost_usd"] += cost_usd
+        self._agg["tokens"] += tokens_used
 
     def trace(self, name: str, user_id: str = None, session_id: str = None):
-        """Start a new trace"""
+        """Start a new trace (or a no-op trace when sampled out)"""
+        trace_id = f"trace_{time.time_ns()}"
+        # TraceIdRatioBased: keep the trace when its id hashes below the sampling threshold
+        if zlib.crc32(trace_id.encode()) >= self._sample_threshold:
+            return _NOOP_TRACE
+
         trace = {
-            "id": f"trace_{int(time.time() * 1000)}",
+            "id": trace_id,
             "name": name,
             "user_id": user_id,
             "session_id": session_id,
-            "timestamp": datetime.utcnow().isoformat(),
+            "start_ns": time.monotonic_ns(),
             "spans": []
         }
         self.traces.append(trace)
+        self._agg["traces"] += 1
         return MockTrace(trace, self)
 
+    def _isoformat(self, monotonic_ns: Optional[int]) -> Optional[str]:
+        """Convert a monotonic timestamp to an ISO wall-clock string"""
+        if monotonic_ns is None:
+            return None
+        return (self._epoch + timedelta(microseconds=(monotonic_ns - self._epoch_ns) // 1000)).isoformat()
+
+    def export_traces(self) -> List[Dict]:
+        """Traces with ISO timestamps, as they would be sent to LangFuse"""
+        exported = []
+        for trace in self.traces:
+            spans = []
+            for span in trace["spans"]:
+                data = {k: v for k, v in span.items() if k not in ("start_ns", "end_ns")}
+                data["start_time"] = self._isoformat(span["start_ns"])
+                data["end_time"] = self._isoformat(span["end_ns"])
+                spans.append(data)
+            data = {k: v for k, v in trace.items() if k not in ("start_ns", "spans")}
+            data["timestamp"] = self._isoformat(trace["start_ns"])
+            data["spans"] = spans
+            exported.append(data)
+        return exported
+
 class MockTrace:
     """Mock trace object"""
 
@@ -54,8 +141,8 @@ class MockTrace:
             "name": name,
             "input": input_data,
             "metadata": metadata,
-            "start_time": datetime.utcnow().isoformat(),
-            "end_time": None,
+            "start_ns": time.monotonic_ns(),
+            "end_ns": None,
             "output": None,
             "latency_ms": 0
         }
@@ -68,22 +155,54 @@ class MockSpan:
     def __init__(self, span_data: Dict, trace: MockTrace):
         self.data = span_data
         self.trace = trace
-        self.start_time = time.time()
-
-    def end(self, output: Dict = None, level: str = "INFO"):
-        """End the span and record output"""
-        end_time = time.time()
-        self.data["end_time"] = datetime.utcnow().isoformat()
-        self.data["latency_ms"] = int((end_time - self.start_time) * 1000)
-        self.data["output"] = output
-        self.data["level"] = level
+        self.start_ns = span_data["start_ns"]
+
+    def end(self, output: Dict = None, level: str = "INFO", **extra):
+        """End the span and record output plus any extra fields (cost_usd, tokens_used, ...)"""
+        end_ns = time.monotonic_ns()
+        self.data.update(
+            end_ns=end_ns,
+            latency_ms=(end_ns - self.start_ns) // 1_000_000,
+            output=output,
+            level=level,
+            **extra
+        )
+        tracer = self.trace.tracer
+        tracer._record_span_end(self.data)
+        if extra:
+            tracer._record_span_usage(extra.get("cost_usd", 0.0), extra.get("tokens_used", 0))
         return self
 
     def update(self, **kwargs):
         """Update span with additional data"""
         self.data.update(kwargs)
+        self.trace.tracer._record_span_usage(kwargs.get("cost_usd", 0.0), kwargs.get("tokens_used", 0))
+        return self
+
+class _NoopSpan:
+    """Span returned for sampled-out traces; records nothing"""
+
+    data = {}
+
+    def end(self, output: Dict = None, level: str = "INFO", **extra):
         return self
 
+    def update(self, **kwargs):
+        return self
+
+
+class _NoopTrace:
+    """Trace returned when sampling drops a trace; its spans inherit the decision"""
+
+    data = {"id": None, "spans": ()}
+
+    def span(self, name: str, input_data: Dict = None, metadata: Dict = None):
+        return _NOOP_SPAN
+
+
+_NOOP_SPAN = _NoopSpan()
+_NOOP_TRACE = _NoopTrace()
+
 # Initialize LangFuse tracer
 tracer = MockLangFuseTracer(LANGFUSE_HOST)
 
@@ -130,7 +249,8 @@ class JobSearchVelocityAgent:
         )
 
         # Simulate market analysis (would use real APIs in production)
-        time.sleep(0.5)  # Simulate processing time
+        if _SIM:
+            time.sleep(_SIM * 0.5)  # Simulate processing time
 
         market_data = {
             "high_velocity_markets": [
@@ -151,8 +271,7 @@ class JobSearchVelocityAgent:
 
         market_span.end(
             output=market_data,
-            level="INFO"
-        ).update(
+            level="INFO",
             cost_usd=0.02,  # Mock API cost
             tokens_used=150,
             model="gpt-4-turbo"
@@ -165,7 +284,8 @@ class JobSearchVelocityAgent:
             metadata={"optimization_type": "velocity_focused"}
         )
 
-        time.sleep(0.3)  # Simulate strategy processing
+        if _SIM:
+            time.sleep(_SIM * 0.3)  # Simulate strategy processing
 
         strategy = {
             "priority_targets": [
@@ -198,8 +318,7 @@ class JobSearchVelocityAgent:
 
         strategy_span.end(
             output=strategy,
-            level="INFO"
-        ).update(
+            level="INFO",
             cost_usd=0.03,
             tokens_used=200,
             model="gpt-4-turbo"
@@ -212,7 +331,8 @@ class JobSearchVelocityAgent:
             metadata={"evaluation_method": "llm_as_judge"}
         )
 
-        time.sleep(0.2)
+        if _SIM:
+            time.sleep(_SIM * 0.2)
 
         # Simulate LLM-as-a-judge evaluation
         evaluation = {
@@ -234,22 +354,28 @@ class JobSearchVelocityAgent:
 
         eval_span.end(
             output=evaluation,
-            level="INFO"
-        ).update(
+            level="INFO",
             cost_usd=0.01,
             tokens_used=100,
             model="gpt-4-turbo"
         )
 
+        # Roll up span metrics in a single pass
+        total_latency_ms = total_cost_usd = total_tokens = 0
+        for span in trace.data["spans"]:
+            total_latency_ms += span["latency_ms"]
+            total_cost_usd += span.get("cost_usd", 0)
+            total_tokens += span.get("tokens_used", 0)
+
         # Complete analysis result
         result = {
             "market_analysis": market_data,
             "application_strategy": strategy,
             "quality_evaluation": evaluation,
             "execution_metrics": {
-                "total_latency_ms": sum(span["latency_ms"] for span in trace.data["spans"]),
-                "total_cost_usd": sum(span.get("cost_usd", 0) for span in trace.data["spans"]),
-                "total_tokens": sum(span.get("tokens_used", 0) for span in trace.data["spans"]),
+                "total_latency_ms": total_latency_ms,
+                "total_cost_usd": total_cost_usd,
+                "total_tokens": total_tokens,
                 "trace_id": trace.data["id"]
             }
         }
@@ -264,19 +390,14 @@ class JobSearchVelocityAgent:
 
     def get_trace_summary(self) -> Dict:
         """Get summary of all traces for evaluation dashboard"""
+        agg = tracer._agg
         return {
-            "total_traces": len(tracer.traces),
-            "traces": tracer.traces,
+            "total_traces": agg["traces"],
+            "traces": tracer.export_traces(),
             "agent_performance": {
-                "avg_latency_ms": sum(
-                    sum(span["latency_ms"] for span in trace["spans"])
-                    for trace in tracer.traces
-                ) / max(len(tracer.traces), 1),
-                "total_cost_usd": sum(
-                    sum(span.get("cost_usd", 0) for span in trace["spans"])
-                    for trace in tracer.traces
-                ),
-                "total_api_calls": sum(len(trace["spans"]) for trace in tracer.traces)
+                "avg_latency_ms": agg["latency_ms"] / max(agg["traces"], 1),
+                "total_cost_usd": agg["cost_usd"],
+                "total_api_calls": agg["spans"]
             }
         }
 
@@ -8,37 +8,63 @@ import os
 import sys
 import json
 import time
-import psutil
+import zlib
+import hashlib
+import functools
 import signal
+import select
 import logging
+import logging.handlers
 from pathlib import Path
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Set, Tuple
 from dataclasses import dataclass
 from datetime import datetime
-import threading
-from claude_logger import ClaudeCodeLogger
+from claude_logger import ClaudeCodeLogger, load_env
+
+try:
+    import orjson
+except ImportError:
+    orjson = None  # Optional: faster registry serialization
 
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
     handlers=[
-        logging.FileHandler(os.path.expanduser('~/.claude/observer.log')),
+        logging.handlers.RotatingFileHandler(
+            os.path.expanduser('~/.claude/observer.log'),
+            maxBytes=5 * 1024 * 1024,
+            backupCount=3,
+            delay=True
+        ),
         logging.StreamHandler()
     ]
 )
 logger = logging.getLogger(__name__)
 
-@dataclass
+_HOME_STR = str(Path.home())
+_HOME = Path(_HOME_STR)
+_HOME_PREFIX = _HOME_STR.rstrip('/') + '/'
+
+_HAS_PROC = os.path.isdir('/proc/self')
+_HAS_PIDFD = hasattr(os, 'pidfd_open') and hasattr(select, 'epoll')
+
+# dataclass(slots=True) needs Python 3.10+; older interpreters keep a per-instance __dict__
+_SLOTS = {"slots": True} if sys.version_info >= (3, 10) else {}
+
+@dataclass(**_SLOTS)
 class ClaudeProcess:
     """Represents a discovered Claude Code process"""
     pid: int
     cmdline: List[str]
     terminal: str
     start_time: float
+    start_time_iso: str = ""
     working_directory: Optional[str] = None
     session_id: Optional[str] = None
     logger_instance: Optional[ClaudeCodeLogger] = None
+    # Start time as read by _read_start_marker; with pid, identifies the process across scans
+    start_marker: float = 0.0
 
 class GlobalClaudeObserver:
     """
@@ -47,78 +73,202 @@ class GlobalClaudeObserver:
 
     def __init__(self):
         self.discovered_processes: Dict[int, ClaudeProcess] = {}
+        # Classified processes by pid, each checked against its start marker on every scan:
+        # Claude processes, confirmed non-Claude or already exited processes, and pids whose
+        # cmdline read as non-Claude once and are read again next scan before being settled
+        self._known_claude: Dict[int, ClaudeProcess] = {}
+        self._known_pids: Dict[int, float] = {}
+        self._unsettled: Dict[int, Tuple[float, bytes]] = {}
+        # Exit notifications for instrumented pids (Linux pidfd + epoll); the epoll fd is
+        # opened by monitor_loop so it survives daemonizing, which closes inherited fds
+        self._pidfds: Dict[int, int] = {}
+        self._epoll = None
+        # Exits seen between ticks, reported in the next tick's status record
+        self._terminated_since_tick: List[int] = []
         self.running = False
-        self.registry_file = Path.home() / '.claude' / 'observer_registry.json'
+        self.registry_file = _HOME / '.claude' / 'observer_registry.json'
+        self._registry_digest: Optional[bytes] = None
         self.ensure_directories()
+        load_env()
+
+        # Counters for every discovered process; traces only for a sampled share
+        self.metrics: Dict = {
+            "processes_discovered": 0,
+            "sessions_traced": 0,
+            "sessions_sampled_out": 0,
+            "projects": {}
+        }
+        sample_rate = float(os.getenv("CLAUDE_OBSERVER_TRACE_SAMPLE_RATE", "1.0"))
+        if not 0.0 <= sample_rate <= 1.0:
+            raise ValueError(f"CLAUDE_OBSERVER_TRACE_SAMPLE_RATE must be between 0.0 and 1.0, got {sample_rate}")
+        self._trace_sample_threshold = sample_rate * 0x100000000
 
     def ensure_directories(self):
         """Ensure necessary directories exist"""
-        claude_dir = Path.home() / '.claude'
+        claude_dir = _HOME / '.claude'
         claude_dir.mkdir(exist_ok=True)
 
     def discover_claude_processes(self) -> List[ClaudeProcess]:
         """Discover all running Claude Code processes"""
-        processes = []
+        current_pids = self._list_pids()
+
+        # Forget processes that have exited since the last scan
+        for table in (self._known_claude, self._known_pids, self._unsettled):
+            for pid in table.keys() - current_pids:
+                del table[pid]
+
+        for pid in current_pids:
+            # A process is identified by (pid, start time), so a reused pid is read afresh
+            start_marker = self._read_start_marker(pid)
+            if start_marker is None:
+                continue  # Exited mid-scan or unreadable right now; retried next scan
+
+            known = self._known_claude.get(pid)
+            if known is not None:
+                if known.start_marker == start_marker:
+                    continue
+                del self._known_claude[pid]
+            elif self._known_pids.get(pid) == start_marker:
+                continue
 
-        for proc in psutil.process_iter(['pid', 'name', 'cmdline', 'create_time', 'terminal']):
+            process = self._read_process(pid)
+            if process is None:
+                continue  # Transient read error; retried next scan
+            raw_cmdline, name = process
+
+            # Check if this is a Claude Code process
+            if not self._is_claude_process(raw_cmdline, name):
+                # Only settle on "not Claude" once the cmdline reads the same on two scans;
+                # a process mid-exec or still setting its title (node shebangs) gets another look
+                if self._unsettled.get(pid) == (start_marker, raw_cmdline):
+                    del self._unsettled[pid]
+                    self._known_pids[pid] = start_marker
+                else:
+                    self._unsettled[pid] = (start_marker, raw_cmdline)
+                continue
+
+            self._unsettled.pop(pid, None)
+            self._known_pids.pop(pid, None)
+            cmdline = raw_cmdline.rstrip(b'\x00').decode(errors='replace').split('\x00') if raw_cmdline else []
+
+            import psutil
             try:
-                info = proc.info
-                cmdline = info['cmdline'] or []
-
-                # Check if this is a Claude Code process
-                if self._is_claude_process(cmdline, info['name']):
-                    # Extract terminal session
-                    terminal = self._extract_terminal(proc)
-
-                    # Get working directory
-                    try:
-                        cwd = proc.cwd()
-                    except (psutil.NoSuchProcess, psutil.AccessDenied):
-                        cwd = None
-
-                    claude_proc = ClaudeProcess(
-                        pid=info['pid'],
-                        cmdline=cmdline,
-                        terminal=terminal,
-                        start_time=info['create_time'],
-                        working_directory=cwd
-                    )
-                    processes.append(claude_proc)
+                proc = psutil.Process(pid)
 
-            except (psutil.NoSuchProcess, psutil.AccessDenied, psutil.ZombieProcess):
-                continue
+                # Extract terminal session
+                terminal = self._extract_terminal(proc)
+
+                # Get working directory
+                try:
+                    cwd = proc.cwd()
+                except (psutil.NoSuchProcess, psutil.AccessDenied):
+                    cwd = None
+
+                start_time = proc.create_time()
+                self._known_claude[pid] = ClaudeProcess(
+                    pid=pid,
+                    cmdline=cmdline,
+                    terminal=terminal,
+                    start_time=start_time,
+                    start_time_iso=datetime.fromtimestamp(start_time).isoformat(),
+                    working_directory=cwd,
+                    start_marker=start_marker
+                )
 
-        return processes
+            except (psutil.NoSuchProcess, psutil.AccessDenied, psutil.ZombieProcess):
+                continue  # Not recorded, so it is retried next scan
 
-    def _is_claude_process(self, cmdline: List[str], name: str) -> bool:
-        """Check if process is a Claude Code instance"""
-        if not cmdline:
-            return False
+        return list(self._known_claude.values())
 
-        # Main claude binary - check if first argument is 'claude'
-        if len(cmdline) > 0 and cmdline[0] == 'claude':
-            # Exclude claude-flow processes
-            if not any('claude-flow' in str(arg) for arg in cmdline):
-                return True
+    @staticmethod
+    def _read_start_marker(pid: int) -> Optional[float]:
+        """Process start time as an identity marker (clock ticks from /proc, else epoch seconds)"""
+        if _HAS_PROC:
+            try:
+                with open(f'/proc/{pid}/stat', 'rb') as f:
+                    # starttime is field 22; fields after the ')' closing comm start at field 3
+                    return float(f.read().rsplit(b')', 1)[1].split()[19])
+            except (OSError, ValueError, IndexError):
+                return None
 
-        # Also check process name for direct claude binary
-        if name == 'claude':
+        import psutil
+        try:
+            return psutil.Process(pid).create_time()
+        except (psutil.NoSuchProcess, psutil.AccessDenied, psutil.ZombieProcess):
+            return None
+
+    @staticmethod
+    def _list_pids() -> Set[int]:
+        """List running pids, straight from /proc where available"""
+        if _HAS_PROC:
+            return {int(entry) for entry in os.listdir('/proc') if entry.isdigit()}
+
+        import psutil
+        return set(psutil.pids())
+
+    @staticmethod
+    def _read_process(pid: int) -> Optional[Tuple[bytes, bytes]]:
+        """Read a process's raw cmdline and name without a full psutil scrape (None on error)"""
+        if _HAS_PROC:
+            try:
+                with open(f'/proc/{pid}/cmdline', 'rb') as f:
+                    raw_cmdline = f.read()
+                # A claude binary always has 'claude' in its argv; skip the comm read otherwise
+                if b'claude' not in raw_cmdline:
+                    return raw_cmdline, b''
+                with open(f'/proc/{pid}/comm', 'rb') as f:
+                    name = f.read().rstrip(b'\n')
+                return raw_cmdline, name
+            except OSError:
+                return None
+
+        import psutil
+        try:
+            proc = psutil.Process(pid)
+            return '\x00'.join(proc.cmdline()).encode(), proc.name().encode()
+        except (psutil.NoSuchProcess, psutil.AccessDenied, psutil.ZombieProcess):
+            return None
+
+    @staticmethod
+    @functools.lru_cache(maxsize=4096)
+    def _is_claude_process(raw_cmdline: bytes, name: bytes) -> bool:
+        """Check if process is a Claude Code instance from its raw NUL-separated cmdline"""
+        # Direct claude binary
+        if name == b'claude':
             return True
 
-        return False
+        # Main claude binary - first argument is exactly 'claude'
+        if not raw_cmdline.startswith(b'claude') or raw_cmdline[6:7] not in (b'\x00', b''):
+            return False
+
+        # Exclude claude-flow processes
+        return b'claude-flow' not in raw_cmdline
 
     def _extract_terminal(self, proc) -> str:
         """Extract terminal session identifier"""
+        pid = proc.pid
+
+        # Fast path: tty_nr (field 7 of /proc/<pid>/stat) is 0 when there is no controlling terminal
+        if _HAS_PROC:
+            try:
+                with open(f'/proc/{pid}/stat', 'rb') as f:
+                    tty_nr = int(f.read().rsplit(b')', 1)[1].split()[4])
+            except (OSError, ValueError, IndexError):
+                return f"unknown_{pid}"
+            if tty_nr == 0:
+                return f"term_{pid}"
+
+        import psutil
         try:
-            # Try to get terminal info from process
+            # Resolve the terminal device name
             terminal_info = proc.terminal()
             if terminal_info:
                 return terminal_info
 
             # Fallback: extract from environment or parent
-            return f"term_{proc.pid}"
-        except:
-            return f"unknown_{proc.pid}"
+            return f"term_{pid}"
+        except (psutil.AccessDenied, psutil.NoSuchProcess, FileNotFoundError):
+            return f"unknown_{pid}"
 
     def instrument_process(self, claude_proc: ClaudeProcess) -> bool:
         """Instrument a Claude process with LangFuse observability"""
@@ -127,85 +277,89 @@ class GlobalClaudeObserver:
             session_id = self._generate_session_id(claude_proc)
             claude_proc.session_id = session_id
 
+            # Extract project information
+            project_name, project_path = self._extract_project_info(claude_proc.working_directory)
+
+            # Metrics path: every discovered process bumps in-memory counters
+            self._record_metrics(project_name)
+
+            # Trace path: only sampled sessions pay for a LangFuse trace
+            if not self._sample_trace(session_id):
+                self.metrics["sessions_sampled_out"] += 1
+                logger.debug(f"Counted Claude process PID {claude_proc.pid} without a trace (sampled out)")
+                return True
+
             # Create logger instance
             logger_instance = ClaudeCodeLogger(
                 user_id=os.getenv("CLAUDE_USER_ID", "global_observer"),
                 session_id=session_id
             )
 
-            # Extract project information
-            project_info = self._extract_project_info(claude_proc.working_directory)
-
             # Start session with rich metadata
             metadata = {
                 "pid": claude_proc.pid,
                 "terminal": claude_proc.terminal,
                 "working_directory": claude_proc.working_directory,
-                "project_name": project_info["name"],
-                "project_path": project_info["path"],
-                "start_time": datetime.fromtimestamp(claude_proc.start_time).isoformat(),
+                "project_name": project_name,
+                "project_path": project_path,
+                "start_time": claude_proc.start_time_iso,
                 "cmdline": ' '.join(claude_proc.cmdline),
                 "auto_instrumented": True,
                 "session_type": "global_observer",
-                "tags": ["claude-code", "auto-discovered", project_info["name"]]
+                "tags": ["claude-code", "auto-discovered", project_name]
             }
 
             logger_instance.start_session(metadata)
             claude_proc.logger_instance = logger_instance
+            self.metrics["sessions_traced"] += 1
 
-            logger.info(f"Instrumented Claude process PID {claude_proc.pid} with session {session_id}")
+            logger.debug(f"Instrumented Claude process PID {claude_proc.pid} with session {session_id}")
             return True
 
         except Exception as e:
             logger.error(f"Failed to instrument process {claude_proc.pid}: {e}")
             return False
 
+    def _record_metrics(self, project_name: str):
+        """Bump the cheap per-discovery counters reported by status()"""
+        self.metrics["processes_discovered"] += 1
+        projects = self.metrics["projects"]
+        projects[project_name] = projects.get(project_name, 0) + 1
+
+    def _sample_trace(self, session_id: str) -> bool:
+        """Head-sampling decision for a session, stable for a given session ID"""
+        return zlib.crc32(session_id.encode()) < self._trace_sample_threshold
+
     def _generate_session_id(self, claude_proc: ClaudeProcess) -> str:
         """Generate unique session ID for a Claude process"""
         timestamp = datetime.fromtimestamp(claude_proc.start_time).strftime("%Y%m%d_%H%M%S")
 
-        # Extract project name from working directory
-        project_name = "unknown"
-        if claude_proc.working_directory:
-            try:
-                path_parts = Path(claude_proc.working_directory).parts
-                if len(path_parts) >= 2:
-                    # Look for github directory structure
-                    if 'github' in path_parts:
-                        github_idx = path_parts.index('github')
-                        if len(path_parts) > github_idx + 1:
-                            project_name = path_parts[github_idx + 1]
-                    else:
-                        # Use last directory name
-                        project_name = path_parts[-1]
-            except:
-                project_name = "unknown"
+        project_name, _ = self._extract_project_info(claude_proc.working_directory)
 
         terminal_short = claude_proc.terminal.split('/')[-1] if '/' in claude_proc.terminal else claude_proc.terminal
         return f"claude_{project_name}_{terminal_short}_{timestamp}_{claude_proc.pid}"
 
-    def _extract_project_info(self, working_directory: Optional[str]) -> Dict[str, str]:
-        """Extract project information from working directory"""
+    @staticmethod
+    @functools.lru_cache(maxsize=1024)
+    def _extract_project_info(working_directory: Optional[str]) -> Tuple[str, str]:
+        """Extract (project name, project path) from working directory"""
         if not working_directory:
-            return {"name": "unknown", "path": "unknown"}
+            return "unknown", "unknown"
 
-        try:
-            path = Path(working_directory)
+        cwd = working_directory.rstrip('/') or '/'
 
-            # Look for github directory structure
-            path_parts = path.parts
-            if 'github' in path_parts:
-                github_idx = path_parts.index('github')
-                if len(path_parts) > github_idx + 1:
-                    project_name = path_parts[github_idx + 1]
-                    project_path = str(path.relative_to(Path.home())) if str(path).startswith(str(Path.home())) else str(path)
-                    return {"name": project_name, "path": project_path}
+        # Look for github directory structure, else use the last directory name
+        github_idx = cwd.find('/github/')
+        project_name = cwd[github_idx + 8:].split('/', 1)[0] if github_idx >= 0 else cwd.rpartition('/')[2]
 
-            # Fallback to directory name
-            return {"name": path.name, "path": str(path.relative_to(Path.home())) if str(path).startswith(str(Path.home())) else str(path)}
+        if cwd == _HOME_STR:
+            project_path = '.'
+        elif cwd.startswith(_HOME_PREFIX):
+            project_path = cwd[len(_HOME_PREFIX):]
+        else:
+            project_path = cwd
 
-        except Exception:
-            return {"name": "unknown", "path": working_directory or "unknown"}
+        return project_name or "unknown", project_path
 
     def save_registry(self):
         """Save current process registry to disk"""
@@ -221,9 +375,22 @@ class GlobalClaudeObserver:
                 "instrumented": proc.logger_instance is not None
             }
 
+        if orjson is not None:
+            blob = orjson.dumps(registry_data, option=orjson.OPT_INDENT_2)
+        else:
+            blob = json.dumps(registry_data, indent=2).encode()
+
+        # Skip the write when nothing changed since the last tick
+        digest = hashlib.blake2b(blob, digest_size=8).digest()
+        if digest == self._registry_digest:
+            return
+
         try:
-            with open(self.registry_file, 'w') as f:
-                json.dump(registry_data, f, indent=2)
+            # Write then rename so load_registry never sees a partial file
+            tmp_file = self.registry_file.with_suffix('.tmp')
+            tmp_file.write_bytes(blob)
+            os.replace(tmp_file, self.registry_file)
+            self._registry_digest = digest
         except Exception as e:
             logger.error(f"Failed to save registry: {e}")
 
@@ -242,6 +409,8 @@ class GlobalClaudeObserver:
         """Main monitoring loop"""
         logger.info("Starting global Claude Code observer...")
         self.running = True
+        if _HAS_PIDFD and self._epoll is None:
+            self._epoll = select.epoll()
 
         # Load existing registry
         existing_registry = self.load_registry()
@@ -249,39 +418,38 @@ class GlobalClaudeObserver:
         while self.running:
             try:
                 # Discover current processes
-                current_processes = self.discover_claude_processes()
+                current = {proc.pid: proc for proc in self.discover_claude_processes()}
 
-                # Track new processes
-                current_pids = {proc.pid for proc in current_processes}
+                # Gone, or the pid now belongs to a different process
+                dead_pids = [
+                    pid for pid, proc in self.discovered_processes.items()
+                    if pid not in current or current[pid].start_marker != proc.start_marker
+                ]
 
                 # Remove dead processes
-                dead_pids = set(self.discovered_processes.keys()) - current_pids
                 for pid in dead_pids:
-                    logger.info(f"Claude process {pid} terminated")
-                    if self.discovered_processes[pid].logger_instance:
-                        try:
-                            self.discovered_processes[pid].logger_instance.end_session("Process terminated")
-                        except:
-                            pass
-                    del self.discovered_processes[pid]
+                    self._process_terminated(pid)
+
+                new_pids = current.keys() - self.discovered_processes.keys()
 
                 # Add new processes
-                for proc in current_processes:
-                    if proc.pid not in self.discovered_processes:
-                        logger.info(f"Discovered new Claude process: PID {proc.pid}, Terminal {proc.terminal}")
+                added = []
+                for pid in new_pids:
+                    proc = current[pid]
 
-                        # Instrument the process
-                        if self.instrument_process(proc):
-                            self.discovered_processes[proc.pid] = proc
+                    # Instrument the process
+                    if self.instrument_process(proc):
+                        self.discovered_processes[pid] = proc
+                        self._watch_exit(pid)
+                        added.append(pid)
 
                 # Save updated registry
                 self.save_registry()
 
-                # Log status
-                active_sessions = len([p for p in self.discovered_processes.values() if p.logger_instance])
-                logger.info(f"Monitoring {len(self.discovered_processes)} Claude processes, {active_sessions} instrumented")
+                # Log status: one record per tick covering every change since the last one
+                self._log_tick(added)
 
-                time.sleep(interval)
+                self._wait_for_exits(interval)
 
             except KeyboardInterrupt:
                 logger.info("Received shutdown signal")
@@ -292,6 +460,85 @@ class GlobalClaudeObserver:
 
         self.cleanup()
 
+    def _log_tick(self, added: List[int]):
+        """Emit the single per-tick status record"""
+        terminated, self._terminated_since_tick = self._terminated_since_tick, []
+        if not logger.isEnabledFor(logging.INFO):
+            return
+
+        total = len(self.discovered_processes)
+        active_sessions = sum(1 for p in self.discovered_processes.values() if p.logger_instance)
+        message = f"Monitoring {total} Claude processes, {active_sessions} instrumented"
+        if added:
+            message += f", new: {sorted(added)}"
+        if terminated:
+            message += f", terminated: {sorted(terminated)}"
+        logger.info(message, extra={"new": added, "terminated": terminated, "total": total})
+
+    def _watch_exit(self, pid: int):
+        """Register a pidfd for pid so its exit wakes the monitor loop"""
+        if self._epoll is None:
+            return
+
+        try:
+            fd = os.pidfd_open(pid)
+        except OSError:
+            return  # Already gone or unsupported; the next rescan will catch it
+
+        try:
+            self._epoll.register(fd, select.EPOLLIN)
+        except OSError:
+            os.close(fd)
+            return
+        self._pidfds[fd] = pid
+
+    def _unwatch_exit(self, pid: int):
+        """Close the pidfd watching pid, if any"""
+        for fd, watched_pid in self._pidfds.items():
+            if watched_pid == pid:
+                del self._pidfds[fd]
+                self._epoll.unregister(fd)
+                os.close(fd)
+                return
+
+    def _wait_for_exits(self, interval: float):
+        """Sleep until the next rescan, ending sessions as soon as their process exits"""
+        if self._epoll is None:
+            time.sleep(interval)
+            return
+
+        deadline = time.monotonic() + interval
+        while self.running:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+
+            for fd, _ in self._epoll.poll(timeout=remaining):
+                pid = self._pidfds.get(fd)
+                if pid is not None:
+                    self._process_terminated(pid)
+
+    def _process_terminated(self, pid: int):
+        """End the session of a Claude process that has exited"""
+        self._unwatch_exit(pid)
+        proc = self.discovered_processes.pop(pid, None)
+        if proc is None:
+            return
+
+        # An unreaped zombie keeps its /proc entry and start time, so settle it as
+        # exited rather than letting the next scan rediscover it as a new process
+        known = self._known_claude.get(pid)
+        if known is not None and known.start_marker == proc.start_marker:
+            del self._known_claude[pid]
+            self._known_pids[pid] = proc.start_marker
+
+        self._terminated_since_tick.append(pid)
+        if proc.logger_instance:
+            try:
+                proc.logger_instance.end_session("Process terminated")
+            except:
+                pass
+
     def cleanup(self):
         """Cleanup all instrumented processes"""
         logger.info("Cleaning up instrumented processes...")
@@ -303,6 +550,13 @@ class GlobalClaudeObserver:
                 except Exception as e:
                     logger.error(f"Error ending session for PID {proc.pid}: {e}")
 
+        if self._epoll is not None:
+            for fd in self._pidfds:
+                os.close(fd)
+            self._pidfds.clear()
+            self._epoll.close()
+            self._epoll = None
+
         self.running = False
         logger.info("Global observer shutdown complete")
 
@@ -316,7 +570,8 @@ class GlobalClaudeObserver:
 
         status = {
             "total_processes": len(self.discovered_processes),
-            "instrumented_processes": len([p for p in self.discovered_processes.values() if p.logger_instance]),
+            "instrumented_processes": sum(1 for p in self.discovered_processes.values() if p.logger_instance),
+            "metrics": self.metrics,
             "processes": []
         }
 
@@ -326,7 +581,7 @@ class GlobalClaudeObserver:
                 "terminal": proc.terminal,
                 "session_id": proc.session_id,
                 "working_directory": proc.working_directory,
-                "start_time": datetime.fromtimestamp(proc.start_time).isoformat(),
+                "start_time": proc.start_time_iso,
                 "instrumented": proc.logger_instance is not None,
                 "trace_url": None
             }
@@ -0,0 +1,119 @@
+"""
+Shared pytest configuration and fixtures for the test suite
+"""
+
+import sys
+import copy
+import pytest
+from pathlib import Path
+from unittest.mock import Mock, create_autospec
+
+# Make the modules under test importable
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from claude_logger import ClaudeCodeLogger
+
+
+def pytest_addoption(parser):
+    parser.addoption("--runslow", action="store_true", default=False, help="run tests marked as slow")
+
+
+def pytest_configure(config):
+    config.addinivalue_line("markers", "slow: marks tests as slow (skipped unless --runslow is given)")
+
+
+def pytest_collection_modifyitems(config, items):
+    """Skip slow tests unless --runslow was passed"""
+    if config.getoption("--runslow"):
+        return
+    skip_slow = pytest.mark.skip(reason="need --runslow option to run")
+    for item in items:
+        if "slow" in item.keywords:
+            item.add_marker(skip_slow)
+
+
+class _CachedSpan:
+    """Reusable no-op span context manager returned by MockLangfuse"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return None
+
+
+_CACHED_SPAN = _CachedSpan()
+
+
+class MockLangfuse:
+    """Mock LangFuse client for testing
+
+    Recorded spans and scores are kept as parallel lists (one per field)
+    rather than a dict per call.
+    """
+
+    _RECORDERS = (
+        "span_names", "span_objs",
+        "score_names", "score_values", "score_trace_ids", "score_comments",
+        "traces",
+    )
+
+    def __init__(self, *args, **kwargs):
+        self.current_span = Mock()
+        self.current_trace_id = "test-trace-123"
+        self.reset()
+
+    def start_as_current_span(self, name):
+        self.span_names.append(name)
+        self.span_objs.append(_CACHED_SPAN)
+        return _CACHED_SPAN
+
+    def update_current_trace(self, **kwargs):
+        self.traces.append(kwargs)
+
+    def update_current_span(self, input=None, output=None, metadata=None):
+        pass
+
+    def get_current_trace_id(self):
+        return self.current_trace_id
+
+    def create_score(self, name, trace_id, value, comment=None):
+        self.score_names.append(name)
+        self.score_values.append(value)
+        self.score_trace_ids.append(trace_id)
+        self.score_comments.append(comment)
+
+    def flush(self):
+        self.flush_count += 1
+
+    def reset(self):
+        """Give the client new, empty recording lists"""
+        for attr in self._RECORDERS:
+            setattr(self, attr, [])
+        self.flush_count = 0
+
+    def fresh(self):
+        """Shallow copy with its own, empty recording lists"""
+        client = copy.copy(self)
+        client.reset()
+        return client
+
+
+@pytest.fixture(scope="session")
+def _langfuse_template():
+    """MockLangfuse built once; tests get shallow copies with fresh recording lists"""
+    return MockLangfuse()
+
+
+@pytest.fixture
+def mock_langfuse(_langfuse_template):
+    """Fixture providing a mock LangFuse client, copied from the shared template"""
+    return _langfuse_template.fresh()
+
+
+@pytest.fixture(scope="session")
+def _logger_template():
+    """Autospec'd ClaudeCodeLogger built once; introspecting the class is the costly part"""
+    template = create_autospec(ClaudeCodeLogger, instance=True)
+    template.langfuse = Mock()
+    return template
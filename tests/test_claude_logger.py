@@ -4,62 +4,52 @@ Test suite for ClaudeCodeLogger
 """
 
 import os
+import json
 import time
 import pytest
 from unittest.mock import Mock, patch, MagicMock
 from datetime import datetime
 
-# Import the module under test
 import sys
 from pathlib import Path
-sys.path.insert(0, str(Path(__file__).parent.parent))
 
-from claude_logger import ClaudeCodeLogger, quick_log
+from claude_logger import ClaudeCodeLogger, quick_log, load_env, _encode_payload, _truncate, _EMPTY_DICT, _client_cache, _build_http_client, _drain_log_queue
+import claude_logger
 
 
-class MockLangfuse:
-    """Mock LangFuse client for testing"""
+# Inputs long enough to earn the detailed prompt (>50 chars) and response (>100 chars) bonuses
+_LONG_PROMPT = "a" * 60
+_LONG_RESPONSE = "a" * 150
 
-    def __init__(self, *args, **kwargs):
-        self.spans = []
-        self.scores = []
-        self.traces = []
-        self.current_span = Mock()
-        self.current_trace_id = "test-trace-123"
+# Shared tool lists; tuples since no test mutates them
+_FIVE_TOOLS = tuple({"name": f"tool{i}"} for i in range(5))
+_TWO_TOOLS = (
+    {"name": "Write", "input": {"file": "test.py"}, "success": True},
+    {"name": "Bash", "input": {"command": "python test.py"}, "success": True}
+)
 
-    def start_as_current_span(self, name):
-        span = Mock()
-        span.__enter__ = Mock(return_value=span)
-        span.__exit__ = Mock(return_value=None)
-        self.spans.append({"name": name, "span": span})
-        return span
 
-    def update_current_span(self, input=None, output=None, metadata=None):
-        pass
+def _raise(msg):
+    """Build a callable that raises Exception(msg), standing in for Mock(side_effect=...)"""
+    def fail(*args, **kwargs):
+        raise Exception(msg)
+    return fail
 
-    def get_current_trace_id(self):
-        return self.current_trace_id
 
-    def create_score(self, name, trace_id, value, comment=None):
-        self.scores.append({
-            "name": name,
-            "trace_id": trace_id,
-            "value": value,
-            "comment": comment
-        })
-
-    def flush(self):
-        pass
+@pytest.fixture(autouse=True)
+def clear_client_cache(monkeypatch):
+    """Ensure each test constructs its own (patched) LangFuse client"""
+    # LangFuse is patched out, so a real pool (and its SSL context) would only cost time
+    monkeypatch.setattr(claude_logger, "_build_http_client", Mock)
+    _client_cache.clear()
+    yield
+    _client_cache.clear()
+    claude_logger._http_clients.clear()
 
 
 class TestClaudeCodeLogger:
     """Test cases for ClaudeCodeLogger"""
 
-    @pytest.fixture
-    def mock_langfuse(self):
-        """Fixture providing a mock LangFuse client"""
-        return MockLangfuse()
-
     @pytest.fixture
     def logger(self, mock_langfuse):
         """Fixture providing a ClaudeCodeLogger with mocked LangFuse"""
@@ -71,6 +61,14 @@ class TestClaudeCodeLogger:
             logger.langfuse = mock_langfuse
             return logger
 
+    @pytest.fixture
+    def patched_span(self, logger):
+        """Fixture patching start_as_current_span with a context-manager Mock"""
+        with patch.object(logger.langfuse, 'start_as_current_span') as mock_span:
+            mock_span.return_value.__enter__ = Mock()
+            mock_span.return_value.__exit__ = Mock()
+            yield mock_span
+
     def test_initialization(self):
         """Test logger initialization"""
         with patch('claude_logger.Langfuse') as mock_langfuse_class:
@@ -100,57 +98,113 @@ class TestClaudeCodeLogger:
             assert logger.session_id.startswith("claude_session_")
             assert logger.interaction_count == 0
 
-    def test_start_session(self, logger, mock_langfuse):
+    def test_start_session(self, logger, patched_span):
         """Test session start functionality"""
         metadata = {"project": "test", "goal": "testing"}
 
-        with patch.object(logger.langfuse, 'start_as_current_span') as mock_span:
-            mock_span.return_value.__enter__ = Mock()
-            mock_span.return_value.__exit__ = Mock()
+        session_id = logger.start_session(metadata)
+
+        assert session_id == logger.session_id
+        patched_span.assert_called_once_with(name="claude_code_session")
 
-            session_id = logger.start_session(metadata)
+    def test_start_session_trace_metadata(self, logger, mock_langfuse):
+        """Test shared identifiers are recorded once on the session trace"""
+        logger.start_session({"project_name": "my-project"})
 
-            assert session_id == logger.session_id
-            mock_span.assert_called_once_with(name="claude_code_session")
+        metadata = mock_langfuse.traces[0]["metadata"]
+        assert metadata["user_id"] == "test@example.com"
+        assert metadata["session_id"] == "test-session-123"
+        assert metadata["project"] == "my-project"
 
-    def test_log_interaction_basic(self, logger, mock_langfuse):
+    def test_log_interaction_basic(self, logger, patched_span):
         """Test basic interaction logging"""
-        with patch.object(logger.langfuse, 'start_as_current_span') as mock_span:
-            mock_span.return_value.__enter__ = Mock()
-            mock_span.return_value.__exit__ = Mock()
+        result = logger.log_interaction(
+            user_prompt="Test prompt",
+            claude_response="Test response"
+        )
+
+        assert logger.interaction_count == 1
+        assert result["interaction_id"] == f"{logger.session_id}_1"
+        assert "trace_id" in result
+        patched_span.assert_called_once_with(name="claude_interaction")
+
+    def test_log_interaction_with_tools(self, logger, patched_span):
+        """Test interaction logging with tools"""
+        tools = _TWO_TOOLS
 
+        original = logger._log_tool_usage
+        calls = []
+        logger._log_tool_usage = calls.append
+        try:
             result = logger.log_interaction(
-                user_prompt="Test prompt",
-                claude_response="Test response"
+                user_prompt="Test with tools",
+                claude_response="Used tools successfully",
+                tools_used=tools
             )
 
             assert logger.interaction_count == 1
-            assert result["interaction_id"] == f"{logger.session_id}_1"
-            assert "trace_id" in result
-            mock_span.assert_called_once_with(name="claude_interaction")
+            # Tools are recorded on the interaction span by default
+            assert len(calls) == 0
+        finally:
+            logger._log_tool_usage = original
 
-    def test_log_interaction_with_tools(self, logger, mock_langfuse):
-        """Test interaction logging with tools"""
-        tools = [
-            {"name": "Write", "input": {"file": "test.py"}, "success": True},
-            {"name": "Bash", "input": {"command": "python test.py"}, "success": True}
-        ]
+    def test_log_interaction_with_tool_spans(self, logger, mock_langfuse):
+        """Test CLAUDE_LANGFUSE_TOOL_SPANS logs each tool as its own span"""
+        logger.tool_spans = True
+        tools = _TWO_TOOLS
 
-        with patch.object(logger.langfuse, 'start_as_current_span') as mock_span:
-            mock_span.return_value.__enter__ = Mock()
-            mock_span.return_value.__exit__ = Mock()
+        logger.log_interaction("Test with tools", "Used tools successfully", tools)
 
-            with patch.object(logger, '_log_tool_usage') as mock_tool_log:
-                result = logger.log_interaction(
-                    user_prompt="Test with tools",
-                    claude_response="Used tools successfully",
-                    tools_used=tools
-                )
+        span_names = mock_langfuse.span_names
+        assert span_names == ["claude_interaction", "tool_Write", "tool_Bash"]
+
+    def test_log_interaction_does_not_flush(self, logger, mock_langfuse):
+        """Test interactions are left to the client's background batching"""
+        logger.log_interaction("Test prompt", "Test response")
+
+        assert mock_langfuse.flush_count == 0
+
+    def test_log_interaction_enforce_flush(self, mock_langfuse, monkeypatch):
+        """Test CLAUDE_LANGFUSE_ENFORCE_FLUSH restores per-interaction flushing"""
+        monkeypatch.setenv("CLAUDE_LANGFUSE_ENFORCE_FLUSH", "true")
+        with patch('claude_logger.Langfuse', return_value=mock_langfuse):
+            logger = ClaudeCodeLogger(user_id="test@example.com")
+
+        logger.log_interaction("Test prompt", "Test response")
 
-                assert logger.interaction_count == 1
-                assert mock_tool_log.call_count == 2
+        assert mock_langfuse.flush_count == 1
 
-    def test_log_tool_usage(self, logger, mock_langfuse):
+    def test_drain_log_queue_is_bounded(self, monkeypatch):
+        """Test waiting on the async queue gives up after the timeout instead of hanging"""
+        import queue
+        pending = queue.Queue()
+        monkeypatch.setattr(claude_logger, "_log_queue", pending)
+        pending.put({"type": "interaction"})  # Never picked up, like a stalled worker
+
+        assert _drain_log_queue(0.05) is False
+
+        pending.get()
+        pending.task_done()
+        assert _drain_log_queue(0.05) is True
+
+    def test_log_interaction_async(self, mock_langfuse, monkeypatch):
+        """Test CLAUDE_LANGFUSE_ASYNC queues interactions for the background worker"""
+        monkeypatch.setenv("CLAUDE_LANGFUSE_ASYNC", "true")
+        with patch('claude_logger.Langfuse', return_value=mock_langfuse):
+            logger = ClaudeCodeLogger(user_id="test@example.com")
+
+        result = logger.log_interaction("Test prompt", "Test response")
+
+        assert result["queued"] is True
+        assert result["interaction_count"] == 1
+        assert "trace_id" not in result
+
+        # end_session drains the queue before closing the session
+        logger.end_session(force_flush=True)
+        span_names = mock_langfuse.span_names
+        assert span_names == ["claude_interaction", "session_end"]
+
+    def test_log_tool_usage(self, logger, patched_span):
         """Test individual tool usage logging"""
         tool_info = {
             "name": "Write",
@@ -160,68 +214,80 @@ class TestClaudeCodeLogger:
             "duration_ms": 100
         }
 
-        with patch.object(logger.langfuse, 'start_as_current_span') as mock_span:
-            mock_span.return_value.__enter__ = Mock()
-            mock_span.return_value.__exit__ = Mock()
-
-            logger._log_tool_usage(tool_info)
+        logger._log_tool_usage(tool_info)
 
-            mock_span.assert_called_once_with(name="tool_Write")
+        patched_span.assert_called_once_with(name="tool_Write")
 
-    def test_calculate_quality_score(self, logger):
+    @pytest.mark.parametrize("prompt,response,tools,expected", [
+        ("hi", "hello", None, 0.5),  # Base score
+        (_LONG_PROMPT, "hello", None, 0.7),  # Detailed prompt bonus
+        ("hi", _LONG_RESPONSE, None, 0.7),  # Detailed response bonus
+        ("hi", "hello", _FIVE_TOOLS[:2], 0.7),  # Tool usage bonus
+        (_LONG_PROMPT, _LONG_RESPONSE, _FIVE_TOOLS, 1.0),  # Maximum score
+    ])
+    def test_calculate_quality_score(self, logger, prompt, response, tools, expected):
         """Test quality score calculation"""
-        # Test base score
-        score = logger._calculate_quality_score("hi", "hello")
-        assert score == 0.5
-
-        # Test detailed prompt bonus
-        score = logger._calculate_quality_score("a" * 60, "hello")
-        assert score == 0.7
-
-        # Test detailed response bonus
-        score = logger._calculate_quality_score("hi", "a" * 150)
-        assert score == 0.7
-
-        # Test tool usage bonus
-        tools = [{"name": "tool1"}, {"name": "tool2"}]
-        score = logger._calculate_quality_score("hi", "hello", tools)
-        assert score == 0.7
-
-        # Test maximum score
-        long_prompt = "a" * 60
-        long_response = "a" * 150
-        many_tools = [{"name": f"tool{i}"} for i in range(5)]
-        score = logger._calculate_quality_score(long_prompt, long_response, many_tools)
-        assert score == 1.0
-
-    def test_end_session(self, logger, mock_langfuse):
+        assert logger._calculate_quality_score(prompt, response, tools) == expected
+
+    def test_end_session(self, logger, patched_span):
         """Test session end functionality"""
         # Simulate some interactions
         logger.interaction_count = 3
         logger.current_trace_id = "test-trace-123"
 
-        with patch.object(logger.langfuse, 'start_as_current_span') as mock_span:
-            mock_span.return_value.__enter__ = Mock()
-            mock_span.return_value.__exit__ = Mock()
+        stats = logger.end_session("Test session completed")
+
+        assert "total_interactions" in stats
+        assert stats["total_interactions"] == 3
+        assert "session_duration_seconds" in stats
+        patched_span.assert_called_once_with(name="session_end")
+
+    def test_end_session_empty_session(self, logger, mock_langfuse):
+        """Test an empty session ends without any LangFuse calls"""
+        stats = logger.end_session()
+
+        assert stats["total_interactions"] == 0
+        assert mock_langfuse.span_names == []
+        assert mock_langfuse.flush_count == 0
+
+    def test_start_session_score_opt_in(self, logger, mock_langfuse):
+        """Test the session_active score is only written when enabled"""
+        logger.start_session()
+        assert mock_langfuse.score_names == []
+
+        logger.session_score = True
+        logger.start_session()
+        assert mock_langfuse.score_names == ["session_active"]
+
+    def test_log_tool_usage_empty(self, logger, mock_langfuse):
+        """Test empty tool info is ignored"""
+        logger._log_tool_usage({})
 
-            stats = logger.end_session("Test session completed")
+        assert mock_langfuse.span_names == []
 
-            assert "total_interactions" in stats
-            assert stats["total_interactions"] == 3
-            assert "session_duration_seconds" in stats
-            mock_span.assert_called_once_with(name="session_end")
+    def test_end_session_flushes_in_background(self, logger, mock_langfuse):
+        """Test end_session hands the final flush to a background thread"""
+        logger.end_session("Test session completed")
 
-    def test_get_trace_url(self, logger):
+        assert logger.wait_for_flush(timeout=1.0)
+        assert mock_langfuse.flush_count == 1
+
+    def test_end_session_force_flush(self, logger, mock_langfuse):
+        """Test force_flush flushes synchronously"""
+        logger.end_session("Test session completed", force_flush=True)
+
+        assert mock_langfuse.flush_count == 1
+        assert logger._flush_thread is None
+
+    def test_get_trace_url(self, logger, monkeypatch):
         """Test trace URL generation"""
         logger.current_trace_id = "test-trace-123"
+        monkeypatch.setenv("LANGFUSE_HOST", "http://localhost:3001")
+        monkeypatch.setenv("LANGFUSE_PROJECT_ID", "test-project")
 
-        with patch.dict(os.environ, {
-            "LANGFUSE_HOST": "http://localhost:3001",
-            "LANGFUSE_PROJECT_ID": "test-project"
-        }):
-            url = logger.get_trace_url()
-            expected = "http://localhost:3001/project/test-project/traces/test-trace-123"
-            assert url == expected
+        url = logger.get_trace_url()
+        expected = "http://localhost:3001/project/test-project/traces/test-trace-123"
+        assert url == expected
 
         # Test with custom trace ID
         url = logger.get_trace_url("custom-trace-456")
@@ -261,42 +327,148 @@ class TestClaudeCodeLogger:
             mock_langfuse_class.assert_called_once_with(
                 host="http://custom-host:3000",
                 public_key="pk-test-123",
-                secret_key="sk-test-456"
+                secret_key="sk-test-456",
+                flush_at=50,
+                flush_interval=2.0,
+                httpx_client=next(iter(claude_logger._http_clients.values()))
             )
 
-    def test_langfuse_initialization_with_env_vars(self):
+    def test_langfuse_initialization_with_env_vars(self, monkeypatch):
         """Test LangFuse initialization with environment variables"""
-        with patch.dict(os.environ, {
-            "LANGFUSE_HOST": "http://env-host:3000",
-            "LANGFUSE_PUBLIC_KEY": "pk-env-123",
-            "LANGFUSE_SECRET_KEY": "sk-env-456"
-        }):
-            with patch('claude_logger.Langfuse') as mock_langfuse_class:
-                mock_client = Mock()
-                mock_langfuse_class.return_value = mock_client
-
-                logger = ClaudeCodeLogger()
-
-                mock_langfuse_class.assert_called_once_with(
-                    host="http://env-host:3000",
-                    public_key="pk-env-123",
-                    secret_key="sk-env-456"
-                )
+        monkeypatch.setenv("LANGFUSE_HOST", "http://env-host:3000")
+        monkeypatch.setenv("LANGFUSE_PUBLIC_KEY", "pk-env-123")
+        monkeypatch.setenv("LANGFUSE_SECRET_KEY", "sk-env-456")
+
+        with patch('claude_logger.Langfuse') as mock_langfuse_class:
+            mock_client = Mock()
+            mock_langfuse_class.return_value = mock_client
+
+            logger = ClaudeCodeLogger()
+
+            mock_langfuse_class.assert_called_once_with(
+                host="http://env-host:3000",
+                public_key="pk-env-123",
+                secret_key="sk-env-456",
+                flush_at=50,
+                flush_interval=2.0,
+                httpx_client=next(iter(claude_logger._http_clients.values()))
+            )
+
+    def test_langfuse_initialization_with_httpx_client(self):
+        """Test an injected httpx client is handed to the LangFuse client and left to its owner"""
+        http_client = Mock()
+
+        with patch('claude_logger.Langfuse') as mock_langfuse_class:
+            ClaudeCodeLogger(httpx_client=http_client)
+
+            assert mock_langfuse_class.call_args.kwargs["httpx_client"] is http_client
+
+        ClaudeCodeLogger.shutdown_shared_client()
+        http_client.close.assert_not_called()
+
+    def test_owned_http_client_honors_proxy_env(self, monkeypatch):
+        """Test the shared pool keeps HTTP(S)_PROXY / NO_PROXY handling alongside its socket options"""
+        import httpx
+        monkeypatch.setenv("HTTPS_PROXY", "http://proxy.internal:3128")
+        monkeypatch.setenv("NO_PROXY", "localhost,.corp.example")
+
+        http_client = _build_http_client()
+        try:
+            proxied = http_client._transport_for_url(httpx.URL("https://cloud.langfuse.com"))
+            assert proxied is not http_client._transport
+            assert proxied._pool._proxy_url.host == b"proxy.internal"
+            for url in ("https://localhost:3001", "https://langfuse.corp.example"):
+                assert http_client._transport_for_url(httpx.URL(url)) is http_client._transport
+            for transport in (proxied, http_client._transport):
+                assert list(transport._pool._socket_options) == claude_logger._SOCKET_OPTIONS
+        finally:
+            http_client.close()
+
+    def test_environment_proxies_no_proxy_wildcard(self, monkeypatch):
+        """Test NO_PROXY=* turns every proxy off"""
+        monkeypatch.setenv("HTTPS_PROXY", "http://proxy.internal:3128")
+        monkeypatch.setenv("NO_PROXY", "*")
+
+        assert claude_logger._environment_proxies() == {}
+
+    def test_shutdown_closes_owned_http_client(self, mock_langfuse):
+        """Test the pool built for a shared client is closed after that client's final flush"""
+        order = []
+        mock_langfuse.shutdown = lambda: order.append("shutdown")
+        with patch('claude_logger.Langfuse', return_value=mock_langfuse):
+            ClaudeCodeLogger()
+        http_client, = claude_logger._http_clients.values()
+        http_client.close.side_effect = lambda: order.append("close")
+
+        ClaudeCodeLogger.shutdown_shared_client()
+
+        assert order == ["shutdown", "close"]
+        assert claude_logger._http_clients == {}
+
+    def test_langfuse_initialization_with_batching_env_vars(self, monkeypatch):
+        """Test LANGFUSE_FLUSH_AT / LANGFUSE_FLUSH_INTERVAL tune client batching"""
+        monkeypatch.setenv("LANGFUSE_FLUSH_AT", "200")
+        monkeypatch.setenv("LANGFUSE_FLUSH_INTERVAL", "10")
+
+        with patch('claude_logger.Langfuse') as mock_langfuse_class:
+            ClaudeCodeLogger()
+
+            kwargs = mock_langfuse_class.call_args.kwargs
+            assert kwargs["flush_at"] == 200
+            assert kwargs["flush_interval"] == 10.0
+
+    def test_langfuse_client_is_shared(self):
+        """Test loggers share a LangFuse client only when all connection settings match"""
+        config = {"host": "http://custom-host:3000", "public_key": "pk-test-123", "secret_key": "sk-test-456"}
+
+        with patch('claude_logger.Langfuse', side_effect=lambda **kwargs: Mock()) as mock_langfuse_class:
+            first = ClaudeCodeLogger(config=config)
+            second = ClaudeCodeLogger(config=config)
+            other = ClaudeCodeLogger(config={**config, "public_key": "pk-other"})
+            other_secret = ClaudeCodeLogger(config={**config, "secret_key": "sk-other"})
+            other_batching = ClaudeCodeLogger(config={**config, "flush_at": 5})
+            injected = ClaudeCodeLogger(config=config, httpx_client=Mock())
+
+        assert first.langfuse is second.langfuse
+        clients = {id(l.langfuse) for l in (first, other, other_secret, other_batching, injected)}
+        assert len(clients) == 5
+        assert mock_langfuse_class.call_count == 5
+
+    def test_shutdown_shared_client(self, mock_langfuse):
+        """Test shutting down flushes the shared clients and empties the cache"""
+        mock_langfuse.shutdown = Mock()
+        with patch('claude_logger.Langfuse', return_value=mock_langfuse):
+            ClaudeCodeLogger()
+
+        ClaudeCodeLogger.shutdown_shared_client()
+
+        mock_langfuse.shutdown.assert_called_once()
+        assert _client_cache == {}
 
     def test_error_handling_in_log_interaction(self, logger):
         """Test error handling in log_interaction"""
         # Mock langfuse to raise an exception
-        logger.langfuse.start_as_current_span = Mock(side_effect=Exception("Test error"))
+        logger.langfuse.start_as_current_span = _raise("Test error")
 
         result = logger.log_interaction("test", "test")
 
         assert "error" in result
         assert result["error"] == "Test error"
 
+    def test_error_handling_logs_warning(self, logger, caplog, capsys):
+        """Test failures are reported through logging rather than stdout"""
+        logger.langfuse.start_as_current_span = _raise("Test error")
+
+        with caplog.at_level("WARNING", logger="claude_logger"):
+            logger.log_interaction("test", "test")
+
+        assert "Failed to log interaction: Test error" in caplog.text
+        assert capsys.readouterr().out == ""
+
     def test_error_handling_in_tool_logging(self, logger):
         """Test error handling in tool logging"""
         # Mock langfuse to raise an exception
-        logger.langfuse.start_as_current_span = Mock(side_effect=Exception("Tool error"))
+        logger.langfuse.start_as_current_span = _raise("Tool error")
 
         # Should not raise exception
         logger._log_tool_usage({"name": "TestTool"})
@@ -336,14 +508,150 @@ class TestQuickLog:
         )
 
 
+class TestLazyImport:
+    """Test cases for deferred LangFuse import"""
+
+    def test_import_does_not_load_langfuse(self):
+        """Test importing the module doesn't pull in the LangFuse SDK"""
+        import subprocess
+        result = subprocess.run(
+            [sys.executable, "-c", "import sys, claude_logger; print('langfuse' in sys.modules)"],
+            cwd=str(Path(__file__).parent.parent),
+            capture_output=True,
+            text=True
+        )
+
+        assert result.stdout.strip() == "False"
+
+
+class TestLoadEnv:
+    """Test cases for .env loading"""
+
+    def test_load_env_keeps_existing_values(self, tmp_path, monkeypatch):
+        """Test .env fills in missing settings without overriding ones already set"""
+        load_env.cache_clear()
+        (tmp_path / ".env").write_text(
+            "LANGFUSE_PUBLIC_KEY=pk-file-123\nCLAUDE_TEST_ENV_VALUE=loaded\n"
+        )
+        monkeypatch.setenv("LANGFUSE_PUBLIC_KEY", "pk-env-123")
+        monkeypatch.delenv("CLAUDE_TEST_ENV_VALUE", raising=False)  # Removed again on teardown
+        with patch('claude_logger.Path.cwd', return_value=tmp_path):
+            assert load_env() == tmp_path / ".env"
+            assert os.environ["LANGFUSE_PUBLIC_KEY"] == "pk-env-123"
+            assert os.environ["CLAUDE_TEST_ENV_VALUE"] == "loaded"
+        load_env.cache_clear()
+
+    def test_load_env_first_match_only(self, tmp_path, monkeypatch):
+        """Test only the first existing .env file is loaded"""
+        load_env.cache_clear()
+        (tmp_path / ".env").write_text("CLAUDE_TEST_ENV_VALUE=loaded\n")
+        monkeypatch.delenv("LANGFUSE_PUBLIC_KEY", raising=False)
+        monkeypatch.delenv("CLAUDE_TEST_ENV_VALUE", raising=False)  # Removed again on teardown
+        with patch('claude_logger.Path.cwd', return_value=tmp_path):
+            assert load_env() == tmp_path / ".env"
+            assert load_env() == tmp_path / ".env"  # cached
+            assert os.environ["CLAUDE_TEST_ENV_VALUE"] == "loaded"
+        load_env.cache_clear()
+
+
+class TestTruncate:
+    """Test cases for payload truncation"""
+
+    def test_truncate_short_string(self):
+        """Test strings within the limit are sent unchanged"""
+        assert _truncate("short", max_chars=10) == "short"
+
+    def test_truncate_long_string(self):
+        """Test long strings keep only their head and tail"""
+        value = "h" * 60 + "t" * 40
+        truncated = _truncate(value, max_chars=40)
+
+        assert truncated == {
+            "truncated": True,
+            "original_len": 100,
+            "head": "h" * 20,
+            "tail": "t" * 10
+        }
+
+    def test_truncate_non_string(self):
+        """Test structured payloads are left alone"""
+        payload = {"file": "test.py"}
+        assert _truncate(payload, max_chars=1) is payload
+
+
+class TestEmptyDefaults:
+    """Test cases for the shared empty defaults"""
+
+    def test_empty_dict_is_read_only(self):
+        """Test the shared empty dict can't be mutated"""
+        with pytest.raises(TypeError):
+            _EMPTY_DICT["key"] = "value"
+        with pytest.raises(TypeError):
+            _EMPTY_DICT.update(key="value")
+
+        assert _EMPTY_DICT == {}
+
+    def test_empty_dict_serializes_as_dict(self):
+        """Test the shared empty dict encodes like a plain dict"""
+        assert json.dumps({"context": _EMPTY_DICT}) == '{"context": {}}'
+
+
+class TestEncodePayload:
+    """Test cases for span payload pre-serialization"""
+
+    def test_encode_payload_with_orjson(self):
+        """Test payloads are encoded to JSON text when orjson is available"""
+        pytest.importorskip("orjson")
+        encoded = _encode_payload({"prompt": "hi", "tools_used": [{"name": "Write"}]})
+
+        assert isinstance(encoded, str)
+        assert json.loads(encoded) == {"prompt": "hi", "tools_used": [{"name": "Write"}]}
+
+    def test_encode_payload_unencodable(self):
+        """Test payloads orjson can't encode are left for the SDK"""
+        payload = {"value": object()}
+
+        assert _encode_payload(payload) is payload
+
+    def test_encode_payload_without_orjson(self):
+        """Test payloads pass through untouched without orjson"""
+        payload = {"prompt": "hi"}
+        with patch('claude_logger.orjson', None):
+            assert _encode_payload(payload) is payload
+
+
+class _FakeClock:
+    """Stand-in for claude_logger's time module; each monotonic() read advances one second"""
+
+    time_ns = staticmethod(time.time_ns)
+
+    def __init__(self):
+        self._now = 0.0
+
+    def monotonic(self):
+        self._now += 1.0
+        return self._now
+
+
 class TestIntegration:
     """Integration tests"""
 
-    def test_full_workflow(self):
+    @pytest.fixture(scope="module")
+    def shared_mock_langfuse(self, _langfuse_template):
+        """One MockLangfuse shared by the integration tests"""
+        return _langfuse_template.fresh()
+
+    @pytest.fixture(autouse=True)
+    def _reset(self, shared_mock_langfuse):
+        """Clear what the previous test recorded on the shared client"""
+        shared_mock_langfuse.reset()
+        yield
+
+    @pytest.mark.slow
+    def test_full_workflow(self, shared_mock_langfuse):
         """Test complete workflow without actual LangFuse calls"""
-        with patch('claude_logger.Langfuse') as mock_langfuse_class:
-            mock_client = MockLangfuse()
-            mock_langfuse_class.return_value = mock_client
+        mock_client = shared_mock_langfuse
+        with patch('claude_logger.Langfuse', return_value=mock_client):
 
             # Test full workflow
             with ClaudeCodeLogger(user_id="integration@test.com") as logger:
@@ -361,20 +669,19 @@ class TestIntegration:
                 )
 
                 assert logger.interaction_count == 2
-                assert len(mock_client.spans) >= 4  # 2 interactions + 3 tools
-                assert len(mock_client.scores) >= 2  # Quality scores for interactions
+                assert len(mock_client.span_names) >= 3  # session + 2 interactions
+                assert len(mock_client.score_names) >= 2  # Quality scores for interactions
 
-    def test_session_statistics(self):
+    @pytest.mark.slow
+    def test_session_statistics(self, shared_mock_langfuse, monkeypatch):
         """Test session statistics calculation"""
-        with patch('claude_logger.Langfuse') as mock_langfuse_class:
-            mock_client = MockLangfuse()
-            mock_langfuse_class.return_value = mock_client
+        monkeypatch.setattr('claude_logger.time', _FakeClock())
 
+        with patch('claude_logger.Langfuse', return_value=shared_mock_langfuse):
             logger = ClaudeCodeLogger(user_id="stats@test.com")
             logger.start_session()
 
-            # Simulate some time passing and interactions
-            time.sleep(0.1)
+            # Simulated time passes on every clock read
             logger.log_interaction("test", "test")
             logger.log_interaction("test2", "test2")
 
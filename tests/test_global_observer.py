@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+Test suite for GlobalClaudeObserver
+"""
+
+import subprocess
+import pytest
+from unittest.mock import Mock
+
+import global_observer
+from global_observer import GlobalClaudeObserver
+
+
+def _process_state(pid):
+    """Single-letter state from /proc/<pid>/stat"""
+    with open(f'/proc/{pid}/stat', 'rb') as f:
+        return f.read().rsplit(b')', 1)[1].split()[0]
+
+
+@pytest.fixture
+def observer(tmp_path, monkeypatch):
+    """Fixture providing an observer whose registry and logs stay out of the real home"""
+    monkeypatch.setattr(global_observer, "_HOME", tmp_path)
+    monkeypatch.setattr(global_observer.logger, "disabled", True)
+    return GlobalClaudeObserver()
+
+
+@pytest.mark.skipif(not (global_observer._HAS_PROC and global_observer._HAS_PIDFD),
+                    reason="needs /proc and pidfd exit notifications")
+class TestZombieProcesses:
+    """Test cases for Claude processes that have exited but not been reaped"""
+
+    def test_unreaped_zombie_instrumented_once(self, observer, monkeypatch):
+        """Test a zombie's pidfd exit isn't followed by rediscovery on every tick"""
+        # argv[0] "claude" makes discovery treat the child as a Claude process; it is
+        # discovered alive on the first tick, then exits and is never reaped
+        child = subprocess.Popen(["claude", "0.1"], executable="sleep")
+        try:
+            instrument = Mock(return_value=True)
+            monkeypatch.setattr(observer, "instrument_process", instrument)
+            terminated = []
+            log_tick = observer._log_tick
+
+            def record_tick(added):
+                terminated.extend(observer._terminated_since_tick)
+                log_tick(added)
+
+            monkeypatch.setattr(observer, "_log_tick", record_tick)
+
+            ticks = []
+            wait_for_exits = observer._wait_for_exits
+
+            def tick(interval):
+                wait_for_exits(0.2)
+                ticks.append(interval)
+                if len(ticks) == 3:
+                    observer.running = False
+
+            monkeypatch.setattr(observer, "_wait_for_exits", tick)
+            observer.monitor_loop()
+
+            instrumented = [call.args[0].pid for call in instrument.call_args_list]
+            assert instrumented.count(child.pid) == 1
+            assert terminated.count(child.pid) == 1
+            assert child.pid not in observer.discovered_processes
+            assert _process_state(child.pid) == b'Z'
+        finally:
+            child.wait()
@@ -5,36 +5,91 @@ Test suite for track.py - Main tracking script
 
 import os
 import sys
+import copy
+import selectors
+import signal
+import builtins
+import contextlib
 import pytest
 from unittest.mock import Mock, patch, MagicMock
-from pathlib import Path
 from io import StringIO
+from datetime import datetime
+from pathlib import Path
 
-# Import the module under test
-sys.path.insert(0, str(Path(__file__).parent.parent))
-
+import track
 from track import ClaudeTracker, main
+from claude_logger import load_env
+
+
+@contextlib.contextmanager
+def swap_attr(obj, name, new):
+    """Temporarily replace obj.name, restoring it afterwards (cheaper than mock.patch)"""
+    old = getattr(obj, name)
+    setattr(obj, name, new)
+    try:
+        yield new
+    finally:
+        setattr(obj, name, old)
+
+
+def _feed(values):
+    """Build an input() replacement returning each value in turn; exception types are raised"""
+    it = iter(values)
+    if all(isinstance(value, str) for value in values):
+        # Plain answers only: hand out the next one with no per-call checks
+        return lambda prompt="": next(it)
+
+    def fake_input(*args, **kwargs):
+        value = next(it)
+        if isinstance(value, type) and issubclass(value, BaseException):
+            raise value
+        return value
+
+    return fake_input
+
+
+def _assert_in(text, *needles):
+    """Assert at least one of needles was printed"""
+    assert any(needle in text for needle in needles), text
+
+
+def _assert_logged(m, printed):
+    """Assert the interactive log command forwarded prompt, response and tools"""
+    m['tracker']._write_queue.join()
+    m['logger'].log_interaction.assert_called_once()
+    call_args = m['logger'].log_interaction.call_args
+    assert call_args[0][0] == 'Test prompt'
+    assert call_args[0][1] == 'Test response'
+    assert len(call_args[0][2]) == 2  # Two tools
 
 
 class TestClaudeTracker:
     """Test cases for ClaudeTracker"""
 
     @pytest.fixture
-    def mock_logger(self):
-        """Fixture providing a mock ClaudeCodeLogger"""
-        logger = Mock()
+    def mock_logger(self, _logger_template):
+        """Fixture providing a mock ClaudeCodeLogger, copied from the shared template"""
+        logger = copy.deepcopy(_logger_template)
         logger.session_id = "test-session-123"
         logger.interaction_count = 0
         logger.user_id = "test@example.com"
-        logger.start_time = Mock()
+        logger.start_time = datetime(2024, 1, 1)
         logger.current_trace_id = "test-trace-456"
         return logger
 
+    @pytest.fixture(autouse=True)
+    def _no_write_wait(self, monkeypatch):
+        """Let the writer thread send batches without waiting for them to fill"""
+        monkeypatch.setattr(track, "_WRITE_MAX_WAIT", 0.0)
+
     @pytest.fixture
-    def tracker(self):
+    def tracker(self, monkeypatch):
         """Fixture providing a ClaudeTracker instance"""
-        with patch.dict(os.environ, {"CLAUDE_USER_ID": "test@example.com"}):
-            return ClaudeTracker()
+        monkeypatch.setenv("CLAUDE_USER_ID", "test@example.com")
+        tracker = ClaudeTracker()
+        yield tracker
+        # Don't leave writer threads or flush workers running into later tests
+        tracker._shutdown_workers(wait=True)
 
     def test_initialization(self, tracker):
         """Test tracker initialization"""
@@ -73,145 +128,297 @@ class TestClaudeTracker:
             assert tracker.tracking is True
             mock_run.assert_called_once()
 
-    def test_run_background_keyboard_interrupt(self, tracker, mock_logger):
-        """Test background mode handles keyboard interrupt"""
-        tracker.logger = mock_logger
-        tracker.tracking = True
+    @patch('track.ClaudeCodeLogger')
+    def test_start_installs_sigterm_handler(self, mock_logger_class, tracker, mock_logger):
+        """Test start() handles SIGTERM while running and restores the old handler afterwards"""
+        mock_logger_class.return_value = mock_logger
+        previous = signal.getsignal(signal.SIGTERM)
+        handlers = []
 
-        with patch('time.sleep', side_effect=KeyboardInterrupt):
-            with patch.object(tracker, 'stop') as mock_stop:
-                tracker._run_background()
-                mock_stop.assert_called_once()
+        with patch.object(tracker, '_run_background',
+                          side_effect=lambda: handlers.append(signal.getsignal(signal.SIGTERM))):
+            tracker.start(background=True)
 
-    def test_run_interactive_quit_command(self, tracker, mock_logger):
-        """Test interactive mode quit command"""
+        assert handlers == [tracker._handle_sigterm]
+        assert signal.getsignal(signal.SIGTERM) is previous
+
+    @patch('track.ClaudeCodeLogger')
+    def test_start_off_main_thread_skips_sigterm_handler(self, mock_logger_class, tracker, mock_logger):
+        """Test a tracker started from a worker thread runs without installing a handler"""
+        import threading
+        mock_logger_class.return_value = mock_logger
+        previous = signal.getsignal(signal.SIGTERM)
+        errors = []
+
+        def run():
+            try:
+                tracker.start(background=True)
+            except Exception as e:
+                errors.append(e)
+
+        with patch.object(tracker, '_run_background'):
+            worker = threading.Thread(target=run)
+            worker.start()
+            worker.join()
+
+        assert errors == []
+        assert signal.getsignal(signal.SIGTERM) is previous
+
+    def test_handle_sigterm_during_stop_is_ignored(self, tracker, mock_logger):
+        """Test a repeated SIGTERM while stop() runs doesn't abort the final flush"""
         tracker.logger = mock_logger
         tracker.tracking = True
 
-        with patch('builtins.input', side_effect=['quit']):
-            with patch.object(tracker, 'stop') as mock_stop:
-                tracker._run_interactive()
-                mock_stop.assert_called_once()
+        def end_session(summary):
+            tracker._handle_sigterm(signal.SIGTERM, None)  # Would raise in interactive mode
+            return {}
 
-    def test_run_interactive_status_command(self, tracker, mock_logger):
-        """Test interactive mode status command"""
-        tracker.logger = mock_logger
+        mock_logger.end_session.side_effect = end_session
+        tracker.stop()
+
+        mock_logger.wait_for_flush.assert_called_once()
+
+    def test_handle_sigterm_background(self, tracker):
+        """Test SIGTERM in background mode stops tracking and wakes the flush loop"""
         tracker.tracking = True
-        mock_logger.session_id = "test-session-123"
-        mock_logger.interaction_count = 5
-        mock_logger.user_id = "test@example.com"
+        tracker._background = True
 
-        with patch('builtins.input', side_effect=['status', 'quit']):
-            with patch('builtins.print') as mock_print:
-                with patch.object(tracker, 'stop'):
-                    tracker._run_interactive()
+        tracker._handle_sigterm(signal.SIGTERM, None)
 
-                # Check that status information was printed
-                printed_text = ' '.join(str(call) for call in mock_print.call_args_list)
-                assert 'Session Status' in printed_text or 'test-session-123' in printed_text
+        assert tracker.tracking is False
+        assert tracker._flush_event.is_set()
 
-    def test_run_interactive_url_command(self, tracker, mock_logger):
-        """Test interactive mode url command"""
-        tracker.logger = mock_logger
+    def test_handle_sigterm_interactive(self, tracker):
+        """Test SIGTERM in interactive mode breaks out of the blocking read"""
         tracker.tracking = True
-        mock_logger.current_trace_id = "test-trace-456"
-        mock_logger.get_trace_url.return_value = "http://localhost:3001/traces/test-trace-456"
 
-        with patch('builtins.input', side_effect=['url', 'quit']):
-            with patch('builtins.print') as mock_print:
-                with patch.object(tracker, 'stop'):
-                    tracker._run_interactive()
+        with pytest.raises(KeyboardInterrupt):
+            tracker._handle_sigterm(signal.SIGTERM, None)
 
-                mock_logger.get_trace_url.assert_called()
+        assert tracker.tracking is False
 
-    def test_run_interactive_log_command(self, tracker, mock_logger):
-        """Test interactive mode log command"""
+    def test_run_background_stops_after_sigterm(self, tracker, mock_logger):
+        """Test the background loop ends and stops cleanly once tracking is switched off"""
         tracker.logger = mock_logger
         tracker.tracking = True
-        mock_logger.log_interaction.return_value = {"interaction_count": 1, "trace_id": "test"}
 
-        input_sequence = [
-            'log',
-            'Test prompt',  # user prompt
-            'Test response',  # claude response
-            'Write,Bash',  # tools used
-            'quit'
-        ]
+        def wait(timeout=None):
+            tracker.tracking = False
+            return True
+
+        with swap_attr(tracker._flush_event, 'wait', wait):
+            with patch.object(tracker, 'stop') as mock_stop:
+                tracker._run_background()
 
-        with patch('builtins.input', side_effect=input_sequence):
-            with patch('builtins.print'):
-                with patch.object(tracker, 'stop'):
-                    tracker._run_interactive()
+        mock_stop.assert_called_once()
+        mock_logger.langfuse.flush.assert_not_called()
 
-                mock_logger.log_interaction.assert_called_once()
-                call_args = mock_logger.log_interaction.call_args
-                assert call_args[0][0] == 'Test prompt'
-                assert call_args[0][1] == 'Test response'
-                assert len(call_args[0][2]) == 2  # Two tools
+    def test_run_background_keyboard_interrupt(self, tracker, mock_logger):
+        """Test background mode handles keyboard interrupt"""
+        tracker.logger = mock_logger
+        tracker.tracking = True
+
+        with swap_attr(tracker._flush_event, 'wait', _feed([KeyboardInterrupt])):
+            with patch.object(tracker, 'stop') as mock_stop:
+                tracker._run_background()
+                mock_stop.assert_called_once()
 
-    def test_run_interactive_log_command_skip(self, tracker, mock_logger):
-        """Test interactive mode log command with skip"""
+    def test_run_background_flushes_new_interactions(self, tracker, mock_logger):
+        """Test background mode flushes and resets the pending count after new interactions"""
         tracker.logger = mock_logger
         tracker.tracking = True
+        tracker._pending = 3
+        waits = _feed([True, KeyboardInterrupt])
 
-        input_sequence = [
-            'log',
-            'skip',  # Skip the log command
-            'quit'
-        ]
+        def wait(timeout=None):
+            mock_logger.interaction_count += 3  # Logged while the flusher slept
+            return waits()
 
-        with patch('builtins.input', side_effect=input_sequence):
-            with patch('builtins.print'):
-                with patch.object(tracker, 'stop'):
-                    tracker._run_interactive()
+        with swap_attr(tracker._flush_event, 'wait', wait):
+            with patch.object(tracker, 'stop'):
+                tracker._run_background()
 
-                mock_logger.log_interaction.assert_not_called()
+        tracker._flush_future.result(timeout=5)
+        mock_logger.langfuse.flush.assert_called_once()
+        assert tracker._pending == 0
 
-    def test_run_interactive_unknown_command(self, tracker, mock_logger):
-        """Test interactive mode unknown command"""
+    def test_run_background_skips_idle_flush(self, tracker, mock_logger, capsys):
+        """Test background mode doesn't flush when nothing was logged since the last wakeup"""
         tracker.logger = mock_logger
         tracker.tracking = True
 
-        with patch('builtins.input', side_effect=['unknown_command', 'quit']):
-            with patch('builtins.print') as mock_print:
-                with patch.object(tracker, 'stop'):
-                    tracker._run_interactive()
+        with swap_attr(tracker._flush_event, 'wait', _feed([True, True, KeyboardInterrupt])):
+            with patch.object(tracker, 'stop'):
+                tracker._run_background()
 
-                # Check that unknown command message was printed
-                printed_text = ' '.join(str(call) for call in mock_print.call_args_list)
-                assert 'Unknown command' in printed_text
+        mock_logger.langfuse.flush.assert_not_called()
+        # Still one heartbeat line per wakeup
+        assert capsys.readouterr().out.count('💚 Active: ') == 2
 
-    def test_run_interactive_keyboard_interrupt(self, tracker, mock_logger):
-        """Test interactive mode handles keyboard interrupt"""
+    def test_flush_if_changed_never_stacks_flushes(self, tracker, mock_logger):
+        """Test a new flush isn't submitted while the previous one is still running"""
+        tracker.logger = mock_logger
+        in_flight = Mock()
+        in_flight.done.return_value = False
+        tracker._flush_future = in_flight
+        mock_logger.interaction_count = 1
+
+        assert tracker._flush_if_changed() is False
+        assert tracker._flushed_count == 0
+
+        in_flight.done.return_value = True
+        assert tracker._flush_if_changed() is True
+        tracker._flush_future.result(timeout=5)
+        mock_logger.langfuse.flush.assert_called_once()
+
+    def test_interaction_logged_wakes_flusher_at_threshold(self, tracker):
+        """Test the flush event is only set once flush_at interactions are pending"""
+        tracker.flush_at = 2
+
+        tracker._interaction_logged()
+        assert not tracker._flush_event.is_set()
+
+        tracker._interaction_logged()
+        assert tracker._flush_event.is_set()
+
+    @pytest.mark.parametrize("inputs,assertion", [
+        pytest.param(['quit'], lambda m, printed: m['stop'].assert_called_once(), id="quit"),
+        pytest.param(['status', KeyboardInterrupt],
+                     lambda m, printed: _assert_in(printed, 'Session Status', 'test-session-123'), id="status"),
+        pytest.param(['url', KeyboardInterrupt], lambda m, printed: m['logger'].get_trace_url.assert_called(), id="url"),
+        pytest.param(['log', 'Test prompt', 'Test response', 'Write,Bash', KeyboardInterrupt], _assert_logged, id="log"),
+        pytest.param(['log', 'skip', KeyboardInterrupt],
+                     lambda m, printed: m['logger'].log_interaction.assert_not_called(), id="log-skip"),
+        pytest.param(['bulk /Tmp/Interactions.jsonl', KeyboardInterrupt],
+                     lambda m, printed: _assert_in(printed, 'Could not read /Tmp/Interactions.jsonl'), id="bulk"),
+        pytest.param(['unknown_command', KeyboardInterrupt],
+                     lambda m, printed: _assert_in(printed, 'Unknown command'), id="unknown"),
+        pytest.param([KeyboardInterrupt], lambda m, printed: m['stop'].assert_called_once(), id="keyboard-interrupt"),
+    ])
+    def test_run_interactive(self, tracker, mock_logger, capsys, inputs, assertion):
+        """Test interactive mode command handling"""
         tracker.logger = mock_logger
         tracker.tracking = True
+        mock_logger.interaction_count = 5
+        mock_logger.get_trace_url.return_value = "http://localhost:3001/traces/test-trace-456"
+        mock_logger.log_interaction.return_value = {"interaction_count": 1, "trace_id": "test"}
 
-        with patch('builtins.input', side_effect=KeyboardInterrupt):
+        with swap_attr(builtins, 'input', _feed(inputs)):
             with patch.object(tracker, 'stop') as mock_stop:
                 tracker._run_interactive()
-                mock_stop.assert_called_once()
 
-    def test_show_status_no_logger(self, tracker):
+        # Every path out of the loop, quit or Ctrl+C, ends the session exactly once
+        mock_stop.assert_called_once()
+        assertion({'stop': mock_stop, 'logger': mock_logger, 'tracker': tracker}, capsys.readouterr().out)
+
+    def test_run_interactive_flushes_when_idle(self, tracker, mock_logger):
+        """Test an idle flush interval in interactive mode flushes new interactions"""
+        tracker.logger = mock_logger
+        tracker.tracking = True
+
+        with patch.object(tracker, '_stdin_selector', return_value=None), \
+                patch.object(tracker, '_read_command', side_effect=[None, KeyboardInterrupt]), \
+                patch.object(tracker, 'stop'):
+            with patch.object(tracker, '_flush_if_changed') as mock_flush:
+                tracker._run_interactive()
+
+        mock_flush.assert_called_once()
+
+    def test_read_command_select_timeout(self, tracker):
+        """Test _read_command returns None when stdin stays quiet for the flush interval"""
+        selector = Mock()
+        selector.select.return_value = []
+        tracker._selector = selector
+
+        assert tracker._read_command(show_prompt=False) is None
+        selector.select.assert_called_once_with(timeout=tracker.flush_interval)
+
+    def test_read_command_pasted_lines(self, tracker):
+        """Test lines pasted in one go are each returned without waiting on stdin again"""
+        read_fd, write_fd = os.pipe()
+        selector = selectors.DefaultSelector()
+        selector.register(read_fd, selectors.EVENT_READ)
+        tracker._selector = selector
+        tracker.flush_interval = 0.01
+        stdin = Mock(encoding="utf-8")
+        stdin.fileno.return_value = read_fd
+        try:
+            os.write(write_fd, b"status\nurl\nqu")
+            with patch('track.sys.stdin', stdin):
+                assert tracker._read_command(show_prompt=False) == "status"
+                assert tracker._read_command(show_prompt=False) == "url"
+                assert tracker._read_command(show_prompt=False) is None  # Partial line
+
+                os.close(write_fd)
+                assert tracker._read_command(show_prompt=False) == "qu"
+                with pytest.raises(EOFError):
+                    tracker._read_command(show_prompt=False)
+        finally:
+            selector.close()
+            os.close(read_fd)
+
+    def test_read_command_select_error_falls_back_to_input(self, tracker):
+        """Test stdin that select() rejects (Windows consoles) is read with input() instead"""
+        selector = Mock()
+        selector.select.side_effect = OSError(10038, "not a socket")
+        tracker._selector = selector
+
+        with patch('builtins.input', return_value="status") as mock_input:
+            assert tracker._read_command(show_prompt=False) == "status"
+            assert tracker._read_command(show_prompt=True) == "status"
+
+        selector.close.assert_called_once()
+        assert tracker._selector is None
+        assert mock_input.call_args_list[-1].args == ("tracker> ",)
+
+    def test_log_prompts_use_pasted_lines(self, tracker):
+        """Test the log prompts answer from lines already read with the pasted command"""
+        tracker._selector = Mock()
+        tracker._stdin_buffer = b"Fix the bug\nDone\nRead, Edit\n"
+
+        with patch.object(tracker, '_enqueue_interaction') as mock_enqueue:
+            tracker._log_manual_interaction()
+
+        mock_enqueue.assert_called_once_with(
+            "Fix the bug", "Done", [{"name": "Read", "success": True}, {"name": "Edit", "success": True}]
+        )
+        tracker._selector.select.assert_not_called()
+
+    def test_stdin_selector_posix_only(self, tracker, monkeypatch):
+        """Test non-POSIX consoles never get a stdin selector"""
+        monkeypatch.setattr(track.os, "name", "nt")
+        with patch('track.sys.stdin') as stdin:
+            stdin.isatty.return_value = True
+            assert tracker._stdin_selector() is None
+
+    def test_show_status_no_logger(self, tracker, capsys):
         """Test show_status when no logger is active"""
         tracker.logger = None
 
-        with patch('builtins.print') as mock_print:
-            tracker._show_status()
+        tracker._show_status()
+
+        assert 'No active session' in capsys.readouterr().out
+
+    def test_show_status_idle(self, tracker, mock_logger, capsys):
+        """Test show_status prints a one-line idle status before any interactions"""
+        tracker.logger = mock_logger
+
+        tracker._show_status()
 
-            printed_text = str(mock_print.call_args_list)
-            assert 'No active session' in printed_text
+        out = capsys.readouterr().out
+        assert 'idle' in out
+        assert 'Duration' not in out
 
-    def test_show_url_no_trace(self, tracker, mock_logger):
+    def test_show_url_no_trace(self, mock_logger, monkeypatch, capsys):
         """Test show_url when no trace ID is available"""
+        monkeypatch.setenv("LANGFUSE_HOST", "http://localhost:3001")
+        tracker = ClaudeTracker()
         tracker.logger = mock_logger
         mock_logger.current_trace_id = None
 
-        with patch('builtins.print') as mock_print:
-            with patch.dict(os.environ, {"LANGFUSE_HOST": "http://localhost:3001"}):
-                tracker._show_url()
+        tracker._show_url()
 
-                printed_text = str(mock_print.call_args_list)
-                assert 'http://localhost:3001/traces' in printed_text
+        assert 'http://localhost:3001/traces' in capsys.readouterr().out
 
     def test_stop(self, tracker, mock_logger):
         """Test stopping the tracker"""
@@ -222,12 +429,83 @@ class TestClaudeTracker:
             "session_duration_seconds": 120
         }
 
-        with patch('builtins.print'):
-            tracker.stop()
+        tracker.stop()
 
         mock_logger.end_session.assert_called_once()
+        mock_logger.wait_for_flush.assert_called_once_with(timeout=5.0)
+        assert tracker.tracking is False
+
+    def test_stop_flush_timeout(self, tracker, mock_logger, capsys):
+        """Test stop() gives up waiting on a slow final flush instead of stalling shutdown"""
+        tracker.logger = mock_logger
+        tracker.tracking = True
+        mock_logger.end_session.return_value = {}
+        mock_logger.wait_for_flush.return_value = False
+
+        tracker.stop()
+
+        assert 'still sending' in capsys.readouterr().out
         assert tracker.tracking is False
 
+    def test_write_loop_batches_queued_interactions(self, tracker, mock_logger):
+        """Test queued manual interactions are logged with one flush for the batch"""
+        tracker.logger = mock_logger
+
+        def log_interaction(*args):
+            mock_logger.interaction_count += 1
+
+        mock_logger.log_interaction.side_effect = log_interaction
+        for i in range(3):
+            tracker._write_queue.put((f"prompt {i}", "response", []))
+
+        tracker._enqueue_interaction("prompt 3", "response", [])
+        tracker._write_queue.join()
+        tracker._flush_future.result(timeout=5)
+
+        assert mock_logger.log_interaction.call_count == 4
+        assert mock_logger.langfuse.flush.call_count == 1
+        assert tracker._pending == 0
+
+    def test_bulk_log(self, tracker, mock_logger, tmp_path, capsys):
+        """Test bulk logging queues each valid JSON line and flushes once for the batch"""
+        tracker.logger = mock_logger
+
+        def log_interaction(*args):
+            mock_logger.interaction_count += 1
+
+        mock_logger.log_interaction.side_effect = log_interaction
+        path = tmp_path / "interactions.jsonl"
+        path.write_text(
+            '{"user_prompt": "p1", "claude_response": "r1", "tools_used": [{"name": "Bash"}]}\n'
+            '\n'
+            'not json\n'
+            '{"user_prompt": "p2", "claude_response": "r2", "duration_ms": 40}\n'
+        )
+
+        with swap_attr(track, "_WRITE_MAX_WAIT", 0.2):
+            tracker._bulk_log(str(path))
+            tracker._write_queue.join()
+        tracker._flush_future.result(timeout=5)
+
+        out = capsys.readouterr().out
+        assert 'Skipping line 3' in out
+        assert 'Queued 2 interactions' in out
+        assert [c.args for c in mock_logger.log_interaction.call_args_list] == [
+            ("p1", "r1", [{"name": "Bash"}], None, None),
+            ("p2", "r2", None, None, 40),
+        ]
+        mock_logger.langfuse.flush.assert_called_once()
+
+    def test_stop_drains_write_queue(self, tracker, mock_logger):
+        """Test stop() waits for queued interactions before ending the session"""
+        tracker.logger = mock_logger
+        mock_logger.end_session.return_value = {}
+        tracker._enqueue_interaction("prompt", "response", [])
+
+        tracker.stop()
+
+        mock_logger.log_interaction.assert_called_once_with("prompt", "response", [])
+
     def test_stop_no_logger(self, tracker):
         """Test stopping tracker when no logger is active"""
         tracker.logger = None
@@ -245,8 +523,7 @@ class TestClaudeTracker:
         mock_logger.get_trace_url.return_value = "http://localhost:3001/traces/test-123"
         mock_logger_class.return_value = mock_logger
 
-        with patch('builtins.print'):
-            result = tracker.test()
+        result = tracker.test()
 
         assert result is True
         mock_logger.start_session.assert_called_once_with({"test": True})
@@ -260,8 +537,7 @@ class TestClaudeTracker:
         mock_logger.log_interaction.return_value = {"interaction_id": "test"}  # No trace_id
         mock_logger_class.return_value = mock_logger
 
-        with patch('builtins.print'):
-            result = tracker.test()
+        result = tracker.test()
 
         assert result is True  # Should still pass
 
@@ -270,8 +546,7 @@ class TestClaudeTracker:
         """Test the test method with connection failure"""
         mock_logger_class.side_effect = Exception("Connection failed")
 
-        with patch('builtins.print'):
-            result = tracker.test()
+        result = tracker.test()
 
         assert result is False
 
@@ -279,102 +554,88 @@ class TestClaudeTracker:
 class TestMain:
     """Test cases for the main function"""
 
+    @pytest.mark.parametrize("argv,user,background,test_ret,exit_code", [
+        (['track.py'], None, False, None, None),  # Default arguments
+        (['track.py', '--background'], None, True, None, None),  # Background flag
+        (['track.py', '--user', 'custom@example.com'], 'custom@example.com', False, None, None),  # Custom user
+        (['track.py', '-b', '-u', 'short@example.com'], 'short@example.com', True, None, None),  # Short flags
+        (['track.py', '--test'], None, None, True, 0),  # Test mode success
+        (['track.py', '--test'], None, None, False, 1),  # Test mode failure
+    ])
     @patch('track.ClaudeTracker')
-    def test_main_default(self, mock_tracker_class):
-        """Test main function with default arguments"""
-        mock_tracker = Mock()
-        mock_tracker_class.return_value = mock_tracker
-
-        with patch('sys.argv', ['track.py']):
-            main()
-
-        mock_tracker_class.assert_called_once_with(user_id=None)
-        mock_tracker.start.assert_called_once_with(background=False)
-
-    @patch('track.ClaudeTracker')
-    def test_main_background_mode(self, mock_tracker_class):
-        """Test main function with background flag"""
-        mock_tracker = Mock()
-        mock_tracker_class.return_value = mock_tracker
-
-        with patch('sys.argv', ['track.py', '--background']):
-            main()
-
-        mock_tracker.start.assert_called_once_with(background=True)
-
-    @patch('track.ClaudeTracker')
-    def test_main_custom_user(self, mock_tracker_class):
-        """Test main function with custom user"""
+    def test_main(self, mock_tracker_class, argv, user, background, test_ret, exit_code):
+        """Test main function argument handling"""
         mock_tracker = Mock()
+        mock_tracker.test.return_value = test_ret
         mock_tracker_class.return_value = mock_tracker
 
-        with patch('sys.argv', ['track.py', '--user', 'custom@example.com']):
-            main()
-
-        mock_tracker_class.assert_called_once_with(user_id='custom@example.com')
-
-    @patch('track.ClaudeTracker')
-    def test_main_test_mode_success(self, mock_tracker_class):
-        """Test main function in test mode with success"""
-        mock_tracker = Mock()
-        mock_tracker.test.return_value = True
-        mock_tracker_class.return_value = mock_tracker
-
-        with patch('sys.argv', ['track.py', '--test']):
+        with patch('sys.argv', argv):
             with patch('sys.exit') as mock_exit:
                 main()
 
-        mock_tracker.test.assert_called_once()
-        mock_exit.assert_called_once_with(0)
+        mock_tracker_class.assert_called_once_with(user_id=user, flush_at=20, flush_interval=30.0)
+        if test_ret is None:
+            mock_tracker.start.assert_called_once_with(background=background)
+            mock_exit.assert_not_called()
+        else:
+            mock_tracker.test.assert_called_once()
+            mock_exit.assert_called_once_with(exit_code)
 
-    @patch('track.ClaudeTracker')
-    def test_main_test_mode_failure(self, mock_tracker_class):
-        """Test main function in test mode with failure"""
-        mock_tracker = Mock()
-        mock_tracker.test.return_value = False
-        mock_tracker_class.return_value = mock_tracker
 
-        with patch('sys.argv', ['track.py', '--test']):
-            with patch('sys.exit') as mock_exit:
-                main()
+class TestLazyImport:
+    """Test cases for deferred dependency imports"""
 
-        mock_tracker.test.assert_called_once()
-        mock_exit.assert_called_once_with(1)
+    def test_import_does_not_load_logger(self):
+        """Test importing the CLI module doesn't pull in the logger"""
+        import subprocess
+        result = subprocess.run(
+            [sys.executable, "-c",
+             "import sys, track; print('claude_logger' in sys.modules)"],
+            cwd=str(Path(__file__).parent.parent),
+            capture_output=True,
+            text=True
+        )
 
-    @patch('track.ClaudeTracker')
-    def test_main_short_flags(self, mock_tracker_class):
-        """Test main function with short flag arguments"""
-        mock_tracker = Mock()
-        mock_tracker_class.return_value = mock_tracker
-
-        with patch('sys.argv', ['track.py', '-b', '-u', 'short@example.com']):
-            main()
-
-        mock_tracker_class.assert_called_once_with(user_id='short@example.com')
-        mock_tracker.start.assert_called_once_with(background=True)
+        assert result.stdout.strip() == "False"
 
 
 class TestEnvironmentVariables:
     """Test environment variable handling"""
 
-    def test_env_var_user_id(self):
+    def test_env_var_user_id(self, monkeypatch):
         """Test CLAUDE_USER_ID environment variable"""
-        with patch.dict(os.environ, {"CLAUDE_USER_ID": "env@example.com"}):
-            tracker = ClaudeTracker()
-            assert tracker.user_id == "env@example.com"
+        monkeypatch.setenv("CLAUDE_USER_ID", "env@example.com")
+        tracker = ClaudeTracker()
+        assert tracker.user_id == "env@example.com"
 
-    def test_env_var_langfuse_host(self):
+    def test_env_var_langfuse_host(self, monkeypatch, capsys):
         """Test LANGFUSE_HOST environment variable usage"""
-        with patch.dict(os.environ, {"LANGFUSE_HOST": "http://custom:3000"}):
+        monkeypatch.setenv("LANGFUSE_HOST", "http://custom:3000")
+        tracker = ClaudeTracker()
+        tracker.logger = Mock()
+        tracker.logger.current_trace_id = None
+
+        tracker._show_url()
+
+        assert 'http://custom:3000/traces' in capsys.readouterr().out
+
+    def test_langfuse_host_from_home_env_file(self, tmp_path, monkeypatch):
+        """Test a host set only in ~/.claude/langfuse.env is used by the tracker"""
+        home = tmp_path / "home"
+        (home / ".claude").mkdir(parents=True)
+        (home / ".claude" / "langfuse.env").write_text("LANGFUSE_HOST=http://home-env:3000\n")
+        work = tmp_path / "work"
+        work.mkdir()
+        monkeypatch.setenv("HOME", str(home))
+        monkeypatch.chdir(work)
+        monkeypatch.delenv("LANGFUSE_HOST", raising=False)  # Removed again on teardown
+        load_env.cache_clear()
+        try:
             tracker = ClaudeTracker()
-            tracker.logger = Mock()
-            tracker.logger.current_trace_id = None
-
-            with patch('builtins.print') as mock_print:
-                tracker._show_url()
+        finally:
+            load_env.cache_clear()
 
-            printed_text = str(mock_print.call_args_list)
-            assert 'http://custom:3000/traces' in printed_text
+        assert tracker._langfuse_host == "http://home-env:3000"
 
 
 if __name__ == "__main__":
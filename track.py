@@ -5,35 +5,101 @@ Claude Code Tracker - Main tracking script for Claude Code interactions
 
 import os
 import sys
+import json
 import time
+import queue
+import signal
 import argparse
-from datetime import datetime
-from pathlib import Path
-from typing import Optional
+import selectors
+import threading
+from concurrent import futures
+from datetime import datetime, timezone
+from typing import TYPE_CHECKING, Optional
 
-# Try to import required modules
-try:
-    from claude_logger import ClaudeCodeLogger
-    from dotenv import load_dotenv
-except ImportError as e:
-    print(f"❌ Missing dependency: {e}")
-    print("Run: pip install -r requirements.txt")
-    exit(1)
+if TYPE_CHECKING:
+    from claude_logger import ClaudeCodeLogger, load_env
+else:
+    # Imported by _load_dependencies() on first tracker construction, so `--help`
+    # doesn't pay for the logger and LangFuse
+    ClaudeCodeLogger = load_env = None
+
+# Most queued manual interactions written before one consolidated flush, and the longest
+# the writer waits for a batch to fill once the first interaction arrives
+_WRITE_BATCH = 256
+_WRITE_MAX_WAIT = 0.2
+
+# Longest stop() waits for the final flush before handing it over to the exit-time shutdown
+_STOP_FLUSH_TIMEOUT = 5.0
+
+_HEARTBEAT_PREFIX = "💚 Active: "
+
+
+def _load_dependencies():
+    """Import the tracker's runtime dependencies, exiting with a hint if any are missing"""
+    global ClaudeCodeLogger, load_env
+    if ClaudeCodeLogger is not None:
+        return
+    try:
+        from claude_logger import ClaudeCodeLogger, load_env
+    except ImportError as e:
+        print(f"❌ Missing dependency: {e}")
+        print("Run: pip install -r requirements.txt")
+        sys.exit(1)
+
+
+def _write_lines(*lines: str):
+    """Emit a block of lines with a single stdout write instead of one print() per line"""
+    sys.stdout.write("\n".join(lines) + "\n")
 
 
 class ClaudeTracker:
     """Main tracker for Claude Code interactions"""
 
-    def __init__(self, user_id: Optional[str] = None):
-        """Initialize the tracker"""
-        # Load environment variables
-        env_file = Path(".env")
-        if env_file.exists():
-            load_dotenv(env_file)
+    def __init__(self,
+                 user_id: Optional[str] = None,
+                 flush_at: int = 20,
+                 flush_interval: float = 30.0):
+        """
+        Initialize the tracker
+
+        Args:
+            user_id: User identifier (defaults to CLAUDE_USER_ID)
+            flush_at: Flush early once this many interactions are pending
+            flush_interval: Maximum seconds between background flushes
+        """
+        _load_dependencies()
+
+        # Load environment variables (./.env or ~/.claude/langfuse.env) before reading the host
+        load_env()
 
         self.user_id = user_id or os.getenv("CLAUDE_USER_ID", "user@example.com")
+        self._langfuse_host = os.getenv("LANGFUSE_HOST", "http://localhost:3001")
         self.logger = None
         self.tracking = False
+        self._stopping = False
+        self._background = False
+        # Monotonic so status durations don't jump with wall-clock (NTP) adjustments
+        self._mono_start = time.monotonic()
+
+        # Background flushes fire every flush_interval seconds, or sooner once flush_at
+        # interactions are pending, mirroring the SDK's own batching knobs
+        self.flush_at = flush_at
+        self.flush_interval = flush_interval
+        self._flush_event = threading.Event()
+        self._pending = 0
+        self._flushed_count = 0
+        # Periodic flushes run on one worker so a slow round trip can't stretch the tick
+        self._flush_pool: Optional[futures.ThreadPoolExecutor] = None
+        self._flush_future: Optional[futures.Future] = None
+
+        # Manual interactions are written and flushed in batches by a worker thread
+        self._write_queue: "queue.Queue[tuple]" = queue.Queue()
+        self._writer: Optional[threading.Thread] = None
+
+        # Interactive stdin polled for idle flushes (None: plain input()), and bytes read
+        # from it that don't yet form a full line
+        self._selector: Optional[selectors.BaseSelector] = None
+        self._stdin_buffer = b""
 
     def start(self, background: bool = False):
         """
@@ -42,59 +108,109 @@ class ClaudeTracker:
         Args:
             background: Run in background mode
         """
-        print("🚀 Claude Code LangFuse Tracker")
-        print("=" * 50)
-        print(f"User: {self.user_id}")
-        print(f"LangFuse: {os.getenv('LANGFUSE_HOST', 'http://localhost:3001')}")
-        print(f"Mode: {'Background' if background else 'Interactive'}")
-        print("=" * 50)
+        _write_lines(
+            "🚀 Claude Code LangFuse Tracker",
+            "=" * 50,
+            f"User: {self.user_id}",
+            f"LangFuse: {self._langfuse_host}",
+            f"Mode: {'Background' if background else 'Interactive'}",
+            "=" * 50
+        )
 
         # Initialize logger
         self.logger = ClaudeCodeLogger(user_id=self.user_id)
+        self._mono_start = time.monotonic()
         self.logger.start_session({
             "mode": "background" if background else "interactive",
-            "start_time": datetime.now().isoformat()
+            "start_time": datetime.now(timezone.utc).isoformat()
         })
 
         self.tracking = True
-
-        if background:
-            self._run_background()
-        else:
-            self._run_interactive()
+        self._stopping = False
+        self._background = background
+
+        # Orchestrators (systemd, Kubernetes) stop processes with SIGTERM, not Ctrl+C;
+        # signal handlers can only be installed from the main thread
+        handle_sigterm = threading.current_thread() is threading.main_thread()
+        if handle_sigterm:
+            previous_handler = signal.signal(signal.SIGTERM, self._handle_sigterm)
+        try:
+            if background:
+                self._run_background()
+            else:
+                self._run_interactive()
+        finally:
+            if handle_sigterm:
+                signal.signal(signal.SIGTERM, previous_handler)
+
+    def _handle_sigterm(self, signum, frame):
+        """Stop tracking on SIGTERM so buffered traces are flushed before exit"""
+        if self._stopping:
+            # Already shutting down; a repeated SIGTERM mustn't interrupt the final flush
+            return
+        self.tracking = False
+        # Wake the background loop now rather than at the end of its flush interval
+        self._flush_event.set()
+        if not self._background:
+            # Interactive mode is blocked reading stdin; leave it the same way Ctrl+C does
+            raise KeyboardInterrupt
 
     def _run_background(self):
         """Run in background mode"""
-        print("\n📡 Running in background mode...")
-        print("   All Claude Code interactions will be tracked automatically")
-        print("   Press Ctrl+C to stop\n")
+        _write_lines(
+            "\n📡 Running in background mode...",
+            "   All Claude Code interactions will be tracked automatically",
+            "   Press Ctrl+C to stop\n"
+        )
 
+        self._flushed_count = self.logger.interaction_count
         try:
             while self.tracking:
-                # Flush any pending data every 30 seconds
-                self.logger.langfuse.flush()
-                print(f"💚 Active: {datetime.now().strftime('%H:%M:%S')}")
-                time.sleep(30)
+                # Sleep until the flush interval expires or enough interactions pile up
+                self._flush_event.wait(timeout=self.flush_interval)
+                if not self.tracking:
+                    # Woken by SIGTERM; stop() does the final flush
+                    break
+                self._flush_if_changed()
+                sys.stdout.write(_HEARTBEAT_PREFIX + time.strftime("%H:%M:%S\n"))
 
         except KeyboardInterrupt:
-            print("\n🛑 Stopping tracker...")
-            self.stop()
+            pass
+
+        print("\n🛑 Stopping tracker...")
+        self.stop()
 
     def _run_interactive(self):
         """Run in interactive mode"""
-        print("\n📝 Running in interactive mode...")
-        print("   Commands:")
-        print("   - 'log': Log an interaction manually")
-        print("   - 'status': Show session status")
-        print("   - 'url': Get dashboard URL")
-        print("   - 'quit': Stop tracking\n")
-
+        _write_lines(
+            "\n📝 Running in interactive mode...",
+            "   Commands:",
+            "   - 'log': Log an interaction manually",
+            "   - 'bulk <file>': Log interactions from a JSON-lines file",
+            "   - 'status': Show session status",
+            "   - 'url': Get dashboard URL",
+            "   - 'quit': Stop tracking\n"
+        )
+
+        self._flushed_count = self.logger.interaction_count
+        self._selector = self._stdin_selector()
+        show_prompt = True
         try:
             while self.tracking:
-                command = input("tracker> ").strip().lower()
+                command = self._read_command(show_prompt)
+                show_prompt = command is not None
+                if command is None:
+                    # No input for a whole flush interval: use the idle time to flush
+                    self._flush_if_changed()
+                    continue
+                # Only the command word is case-insensitive; its argument (a path) is kept as typed
+                command, _, argument = command.strip().partition(" ")
+                command = command.lower()
 
                 if command == "log":
                     self._log_manual_interaction()
+                elif command == "bulk":
+                    self._bulk_log(argument.strip())
                 elif command == "status":
                     self._show_status()
                 elif command == "url":
@@ -107,40 +223,230 @@ class ClaudeTracker:
         except (KeyboardInterrupt, EOFError):
             print("\n")
 
+        finally:
+            if self._selector is not None:
+                self._selector.close()
+                self._selector = None
+
         self.stop()
 
+    @staticmethod
+    def _stdin_selector() -> Optional[selectors.BaseSelector]:
+        """Selector watching an interactive POSIX stdin, or None where stdin can't be polled"""
+        # Windows select() only takes sockets, so consoles there block in input()
+        if os.name != "posix" or not sys.stdin.isatty():
+            return None
+        selector = selectors.DefaultSelector()
+        try:
+            selector.register(sys.stdin.fileno(), selectors.EVENT_READ)
+        except (ValueError, OSError):
+            selector.close()
+            return None
+        return selector
+
+    def _read_command(self, show_prompt: bool) -> Optional[str]:
+        """
+        Read the next command line
+
+        Args:
+            show_prompt: Print the prompt (False while still waiting on the previous one)
+
+        Returns:
+            The raw command, or None if flush_interval passed without input
+        """
+        if self._selector is None:
+            return input("tracker> ")
+
+        if show_prompt:
+            sys.stdout.write("tracker> ")
+            sys.stdout.flush()
+        return self._read_line(timeout=self.flush_interval)
+
+    def _input(self, prompt: str) -> str:
+        """input() that reads through the stdin selector while one is active"""
+        if self._selector is None:
+            return input(prompt)
+
+        sys.stdout.write(prompt)
+        sys.stdout.flush()
+        return self._read_line(timeout=None)
+
+    def _read_line(self, timeout: Optional[float]) -> Optional[str]:
+        """
+        Read one line from the polled stdin
+
+        Reads the fd directly rather than through sys.stdin, whose buffer would hide
+        already-pasted lines from select(). Falls back to input() if select() fails.
+
+        Args:
+            timeout: Seconds to wait for a full line (None waits indefinitely)
+
+        Returns:
+            The line without its newline, or None on timeout
+        """
+        while True:
+            line, newline, rest = self._stdin_buffer.partition(b"\n")
+            if newline:
+                self._stdin_buffer = rest
+                return line.decode(sys.stdin.encoding or "utf-8", errors="replace")
+
+            try:
+                ready = self._selector.select(timeout=timeout)
+            except OSError:
+                # stdin turned out not to be pollable; block in input() from now on
+                self._selector.close()
+                self._selector = None
+                return input()
+            if not ready:
+                return None
+
+            chunk = os.read(sys.stdin.fileno(), 4096)
+            if not chunk:
+                if not self._stdin_buffer:
+                    raise EOFError
+                chunk = b"\n"  # Hand back the unterminated last line; EOF comes next call
+            self._stdin_buffer += chunk
+
     def _log_manual_interaction(self):
         """Manually log an interaction"""
         print("Enter interaction details (or 'skip' to cancel):")
 
-        prompt = input("  User prompt: ").strip()
+        prompt = self._input("  User prompt: ").strip()
         if prompt.lower() == "skip":
             return
 
-        response = input("  Claude response: ").strip()
+        response = self._input("  Claude response: ").strip()
         if response.lower() == "skip":
             return
 
-        tools_input = input("  Tools used (comma-separated, or enter for none): ").strip()
-        tools = []
-        if tools_input:
-            for tool_name in tools_input.split(","):
-                tools.append({"name": tool_name.strip(), "success": True})
+        tools_input = self._input("  Tools used (comma-separated, or enter for none): ").strip()
+        # Blank entries (including an empty answer) are skipped
+        tools = [{"name": name, "success": True} for name in map(str.strip, tools_input.split(",")) if name]
+
+        self._enqueue_interaction(prompt, response, tools)
+        print(f"✅ Queued interaction ({self._write_queue.qsize()} pending)")
+
+    def _bulk_log(self, path: str):
+        """
+        Queue every interaction in a JSON-lines file for batched logging
+
+        Each line is an object with "user_prompt" and "claude_response", plus optional
+        "tools_used", "context" and "duration_ms" (the log_interaction arguments).
+
+        Args:
+            path: File to read
+        """
+        if not path:
+            print("Usage: bulk <file.jsonl>")
+            return
+
+        try:
+            with open(path, encoding="utf-8") as f:
+                lines = f.readlines()
+        except OSError as e:
+            print(f"❌ Could not read {path}: {e}")
+            return
+
+        queued = 0
+        for line_number, line in enumerate(lines, 1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+                interaction = (record["user_prompt"], record["claude_response"],
+                               record.get("tools_used"), record.get("context"), record.get("duration_ms"))
+            except (ValueError, KeyError, TypeError, AttributeError) as e:
+                print(f"⚠️ Skipping line {line_number}: {e}")
+                continue
+            self._enqueue_interaction(*interaction)
+            queued += 1
+
+        print(f"✅ Queued {queued} interactions from {path}")
+
+    def _enqueue_interaction(self, *interaction):
+        """Hand log_interaction arguments to the writer thread, starting it on first use"""
+        self._write_queue.put(interaction)
+        if self._writer is None:
+            self._writer = threading.Thread(target=self._write_loop, name="tracker-writer", daemon=True)
+            self._writer.start()
+
+    def _write_loop(self):
+        """Log queued interactions in batches with a single flush per batch"""
+        done = False
+        while not done:
+            first = self._write_queue.get()
+            if first is None:
+                self._write_queue.task_done()
+                return
+            batch = [first]
+            # Send when the batch is full or the wait is up, whichever comes first
+            deadline = time.monotonic() + _WRITE_MAX_WAIT
+            while len(batch) < _WRITE_BATCH:
+                try:
+                    item = self._write_queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if item is None:
+                    # Shutdown sentinel: send what we have, then exit
+                    self._write_queue.task_done()
+                    done = True
+                    break
+                batch.append(item)
+
+            try:
+                for interaction in batch:
+                    self.logger.log_interaction(*interaction)
+                    self._interaction_logged()
+                self._flush_if_changed()
+            except Exception as e:
+                print(f"\n⚠️ Failed to log interaction: {e}")
+            finally:
+                for _ in batch:
+                    self._write_queue.task_done()
+
+    def _interaction_logged(self):
+        """Count a pending interaction and wake the flusher once flush_at is reached"""
+        self._pending += 1
+        if self._pending >= self.flush_at:
+            self._flush_event.set()
+
+    def _flush_if_changed(self) -> bool:
+        """
+        Start a background flush if interactions were logged since the last one
 
-        result = self.logger.log_interaction(prompt, response, tools)
-        print(f"✅ Logged interaction {result.get('interaction_count', 0)}")
-        if result.get("trace_id"):
-            print(f"   Trace: {self.logger.get_trace_url(result['trace_id'])}")
+        Returns:
+            True if a flush was submitted
+        """
+        self._flush_event.clear()
+        self._pending = 0
+        # Nothing new was logged, so there is nothing to send
+        count = self.logger.interaction_count
+        if count == self._flushed_count:
+            return False
+        # Never stack flushes; anything logged meanwhile goes out on the next tick
+        if self._flush_future is not None and not self._flush_future.done():
+            return False
+
+        if self._flush_pool is None:
+            self._flush_pool = futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="tracker-flush")
+        self._flush_future = self._flush_pool.submit(self.logger.langfuse.flush)
+        self._flushed_count = count
+        return True
 
     def _show_status(self):
         """Show current session status"""
-        if self.logger:
-            print(f"\n📊 Session Status:")
-            print(f"   Session ID: {self.logger.session_id}")
-            print(f"   Interactions: {self.logger.interaction_count}")
-            print(f"   User: {self.logger.user_id}")
-            duration = (datetime.now() - self.logger.start_time).total_seconds()
-            print(f"   Duration: {duration:.0f} seconds")
+        if self.logger and self.logger.interaction_count == 0:
+            # Nothing to report beyond the session itself
+            print(f"\n📊 Session {self.logger.session_id}: idle (no interactions yet)")
+        elif self.logger:
+            duration = time.monotonic() - self._mono_start
+            _write_lines(
+                "\n📊 Session Status:",
+                f"   Session ID: {self.logger.session_id}",
+                f"   Interactions: {self.logger.interaction_count}",
+                f"   User: {self.logger.user_id}",
+                f"   Duration: {duration:.0f} seconds"
+            )
         else:
             print("No active session")
 
@@ -148,25 +454,48 @@ class ClaudeTracker:
         """Show dashboard URL"""
         if self.logger and self.logger.current_trace_id:
             url = self.logger.get_trace_url()
-            print(f"\n🔗 Dashboard URL:")
-            print(f"   {url}")
         else:
-            host = os.getenv("LANGFUSE_HOST", "http://localhost:3001")
-            print(f"\n🔗 Dashboard URL:")
-            print(f"   {host}/traces")
+            url = f"{self._langfuse_host}/traces"
+        _write_lines("\n🔗 Dashboard URL:", f"   {url}")
 
     def stop(self):
         """Stop tracking"""
+        self._stopping = True
         if self.logger:
+            # Queued manual interactions must land before the session is closed
+            if self._writer is not None:
+                self._write_queue.join()
             stats = self.logger.end_session("Tracking session completed")
-            print(f"\n📊 Session Summary:")
-            print(f"   Total interactions: {stats.get('total_interactions', 0)}")
-            print(f"   Duration: {stats.get('session_duration_seconds', 0):.0f}s")
-            print(f"\n✅ Tracking stopped")
-            print(f"   View traces at: {os.getenv('LANGFUSE_HOST', 'http://localhost:3001')}")
+            _write_lines(
+                "\n📊 Session Summary:",
+                f"   Total interactions: {stats.get('total_interactions', 0)}",
+                f"   Duration: {stats.get('session_duration_seconds', 0):.0f}s",
+                "\n✅ Tracking stopped",
+                f"   View traces at: {self._langfuse_host}"
+            )
 
+            # end_session only starts the final flush; wait a bounded time rather than
+            # stalling shutdown on a slow LangFuse round trip
+            flushed = self.logger.wait_for_flush(timeout=_STOP_FLUSH_TIMEOUT)
+            if self._flush_future is not None:
+                flushed = flushed and not futures.wait([self._flush_future], timeout=_STOP_FLUSH_TIMEOUT).not_done
+            if not flushed:
+                print(f"   ⚠️ Traces still sending after {_STOP_FLUSH_TIMEOUT:.0f}s; "
+                      f"they will be flushed on exit")
+
+        self._shutdown_workers()
         self.tracking = False
 
+    def _shutdown_workers(self, wait: bool = False):
+        """Stop the writer thread and the flush executor"""
+        if self._writer is not None:
+            self._write_queue.put(None)
+            self._writer.join(timeout=_STOP_FLUSH_TIMEOUT)
+            self._writer = None
+        if self._flush_pool is not None:
+            self._flush_pool.shutdown(wait=wait)
+            self._flush_pool = None
+
     def test(self):
         """Test the tracking setup"""
         print("🧪 Testing Claude Code Tracker...")
@@ -184,24 +513,25 @@ class ClaudeTracker:
             )
 
             if result.get("trace_id"):
-                print("✅ LangFuse connection: OK")
-                print(f"   Test trace: {logger.get_trace_url(result['trace_id'])}")
+                _write_lines(
+                    "✅ LangFuse connection: OK",
+                    f"   Test trace: {logger.get_trace_url(result['trace_id'])}"
+                )
             else:
                 print("⚠️ LangFuse connection: Trace created but no ID returned")
 
             logger.end_session("Test completed")
 
         except Exception as e:
-            print(f"❌ LangFuse connection: Failed")
-            print(f"   Error: {e}")
+            _write_lines("❌ LangFuse connection: Failed", f"   Error: {e}")
             return False
 
         print("\n✅ All tests passed!")
         return True
 
 
-def main():
-    """Main entry point"""
+def _build_parser() -> argparse.ArgumentParser:
+    """Build the command-line parser"""
     parser = argparse.ArgumentParser(
         description="Track Claude Code interactions with LangFuse"
     )
@@ -220,10 +550,34 @@ def main():
         action="store_true",
         help="Test the tracking setup"
     )
+    parser.add_argument(
+        "--flush-at",
+        type=int,
+        default=20,
+        help="Flush once this many interactions are pending (default: 20)"
+    )
+    parser.add_argument(
+        "--flush-interval",
+        type=float,
+        default=30.0,
+        help="Maximum seconds between background flushes (default: 30)"
+    )
+    return parser
+
+
+# Built once at import so repeated main() calls (tests, embedding shells) reuse it
+_PARSER = _build_parser()
 
-    args = parser.parse_args()
 
-    tracker = ClaudeTracker(user_id=args.user)
+def main():
+    """Main entry point"""
+    args = _PARSER.parse_args()
+
+    tracker = ClaudeTracker(
+        user_id=args.user,
+        flush_at=args.flush_at,
+        flush_interval=args.flush_interval
+    )
 
     if args.test:
         success = tracker.test()